@@ -1,94 +1,165 @@
 import sqlite3
-from sklearn.neural_network import MLPClassifier
-import numpy as np
 import os
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import joblib
+import threading
+
+from models import get_model
+
+# scikit-learn, joblib and matplotlib are imported only on the update and
+# plotting paths; suggestions are served from ADJUSTER_NPZ with NumPy alone
 
 DB_PATH = "data/scores.db"
+ADJUSTER_PATH = "data/adjuster.pkl"
+ADJUSTER_NPZ = "data/adjuster.npz"  # Exported weights used by suggest_difficulty
+ADJUSTER_WINDOW = None  # Model reflects only about the most recent N games; None = all
+BOOTSTRAP_EPOCHS = 500  # partial_fit passes over the first batch of games
+UPDATE_EPOCHS = 5       # partial_fit passes over each batch of new games
+PLOT_SURFACE = True     # Render the decision surface PNG after updates
+SURFACE_PATH = "data/adjuster_surface.png"
+SURFACE_RESOLUTION = (4, 30, 10)  # Grid points along difficulty, time, errors
 
-def suggest_difficulty(last_difficulty, last_time, last_errors):
-    # If no DB or not enough data, default to Medium
-    if not os.path.exists(DB_PATH):
-        return "Easy"
+# Encode difficulties
+diff_map = {"Easy":0, "Medium":1, "Hard":2, "Expert":3}
+rev_map = {v:k for k,v in diff_map.items()}
+# _target can step below Easy (-1); such predictions map to "Medium" below
+ADJUSTER_CLASSES = [-1, 0, 1, 2, 3]
+
+def _target(d, t, e):
+    # Next difficulty is one step harder if time < 60 and errors < 2, else same or easier
+    if t < 60 and e < 2 and diff_map[d] < 3:
+        return diff_map[d]+1
+    elif t > 120 or e > 4 and diff_map[d] > 0:
+        return diff_map[d]-1
+    else:
+        return diff_map[d]
+
+def load_adjuster():
+    if os.path.exists(ADJUSTER_PATH):
+        import joblib
+        return joblib.load(ADJUSTER_PATH)
+    return {"clf": None, "last_id": 0, "games": 0, "games_since_build": 0}
+
+def _save_adjuster(state):
+    import joblib
+    from inference import export_npz
+    tmp = ADJUSTER_PATH + ".tmp"
+    joblib.dump(state, tmp)
+    os.replace(tmp, ADJUSTER_PATH)
+    if state["clf"] is not None:
+        export_npz(state["clf"], ADJUSTER_NPZ, last_id=state["last_id"], games=state["games"])
+
+def update_adjuster(window=ADJUSTER_WINDOW):
+    # Train the persisted adjuster on scores rows added since the last update
+    # (high-water mark on scores.id). partial_fit keeps everything learned
+    # before, so with a window the model is rebuilt from the newest `window`
+    # games once `window` games have been added since it was last built; it
+    # then always reflects between `window` and 2 * `window` recent games.
+    state = load_adjuster()
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT difficulty, time, errors FROM scores")
+    c.execute("SELECT id, difficulty, time, errors FROM scores WHERE id > ? ORDER BY id",
+              (state["last_id"],))
     data = c.fetchall()
+    train = data
+    added = state.get("games_since_build", state["games"]) + len(data)
+    if window and data and (state["clf"] is None or added >= window):
+        c.execute("SELECT id, difficulty, time, errors FROM scores ORDER BY id DESC LIMIT ?", (window,))
+        train = c.fetchall()[::-1]
+        state["clf"] = None
+        added = 0
     conn.close()
-    if len(data) < 5:
-        return "Easy"
-    # Encode difficulties
-    diff_map = {"Easy":0, "Medium":1, "Hard":2, "Expert":3}
+    if not data:
+        if state["clf"] is not None and not os.path.exists(ADJUSTER_NPZ):
+            _save_adjuster(state)
+        return state
     X = []
     y = []
-    for d, t, e in data:
+    for _, d, t, e in train:
         if d in diff_map:
             X.append([diff_map[d], t, e])
-            # Next difficulty is one step harder if time < 60 and errors < 2, else same or easier
-            if t < 60 and e < 2 and diff_map[d] < 3:
-                y.append(diff_map[d]+1)
-            elif t > 120 or e > 4 and diff_map[d] > 0:
-                y.append(diff_map[d]-1)
-            else:
-                y.append(diff_map[d])
-    clf = MLPClassifier(hidden_layer_sizes=(5,), max_iter=500)
-    clf.fit(X, y)
-    plot_nn_decision_surface(clf)
-    last = np.array([[diff_map.get(last_difficulty,1), last_time, last_errors]])
-    pred = clf.predict(last)[0]
-    rev_map = {v:k for k,v in diff_map.items()}
-    return rev_map.get(pred, "Medium")
+            y.append(_target(d, t, e))
+    if X:
+        from sklearn.neural_network import MLPClassifier
+        epochs = UPDATE_EPOCHS
+        if state["clf"] is None:
+            state["clf"] = MLPClassifier(hidden_layer_sizes=(5,), max_iter=500)
+            epochs = BOOTSTRAP_EPOCHS
+        clf = state["clf"]
+        prev_loss = None
+        for _ in range(epochs):
+            clf.partial_fit(X, y, classes=ADJUSTER_CLASSES)
+            if prev_loss is not None and abs(prev_loss - clf.loss_) < clf.tol:
+                break
+            prev_loss = clf.loss_
+    state["last_id"] = data[-1][0]
+    state["games"] += len(data)
+    state["games_since_build"] = added
+    _save_adjuster(state)
+    return state
+
+def suggest_difficulty(last_difficulty, last_time, last_errors, update=True):
+    # With update=False the suggestion comes from the last exported weights
+    # (no scikit-learn import); main uses that at startup and updates the
+    # model after the game instead. Without exported weights it updates anyway.
+    # If no DB or not enough data, default to Medium
+    if not os.path.exists(DB_PATH):
+        return "Easy"
+    if update or not os.path.exists(ADJUSTER_NPZ):
+        state = update_adjuster()
+        if PLOT_SURFACE and state["clf"] is not None:
+            render_surface_async(state["clf"])
+    if not os.path.exists(ADJUSTER_NPZ):
+        return "Easy"
+    from inference import classify_batch, load_npz
+    model = get_model(ADJUSTER_NPZ, loader=load_npz)
+    if int(model["extra"]["games"]) < 5:
+        return "Easy"
+    labels, _ = classify_batch([[diff_map.get(last_difficulty,1), last_time, last_errors]], model)
+    return rev_map.get(int(labels[0]), "Medium")
 
 def get_action_features():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT AVG(time_delta), SUM(mistake), COUNT(*) FROM actions")
-    row = c.fetchone()
-    conn.close()
+    from tracking import get_action_totals
+    row = get_action_totals()
     if row:
         avg_time, total_mistakes, total_moves = row
         return [avg_time or 0, total_mistakes or 0, total_moves or 0]
     return [0, 0, 0]
 
-def plot_nn_decision_surface(clf):
-    fig = plt.figure()
+def plot_nn_decision_surface(clf, path=SURFACE_PATH, resolution=SURFACE_RESOLUTION):
+    # Render the suggestion surface to a PNG with the Agg backend, using one
+    # batched predict over a (difficulty, time, errors) grid
+    import numpy as np
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from mpl_toolkits.mplot3d import Axes3D  # Registers the 3d projection
+    n_d, n_t, n_e = resolution
+    d, t, e = np.meshgrid(np.linspace(0, 3, n_d), np.linspace(10, 300, n_t),
+                          np.linspace(0, 8, n_e), indexing="ij")
+    points = np.column_stack([d.ravel(), t.ravel(), e.ravel()])
+    pred = clf.predict(points)
+    colors = np.array(['g', 'b', 'r', 'k'])
+    fig = Figure()
+    FigureCanvasAgg(fig)
     ax = fig.add_subplot(111, projection='3d')
-    d_range = np.arange(0, 4)
-    t_range = np.linspace(10, 300, 8)
-    e_range = np.arange(0, 10, 2)
-    colors = ['g', 'b', 'r', 'k']
-    for d in d_range:
-        for t in t_range:
-            for e in e_range:
-                pred = clf.predict([[d, t, e]])[0]
-                ax.scatter(d, t, e, c=colors[pred], marker='o')
+    ax.scatter(points[:, 0], points[:, 1], points[:, 2], c=colors[pred], marker='o')
     ax.set_xlabel('Difficulty')
     ax.set_ylabel('Time')
     ax.set_zlabel('Errors')
-    plt.title("MLP Difficulty Suggestion Surface")
-    plt.show()
+    ax.set_title("MLP Difficulty Suggestion Surface")
+    tmp = path + ".tmp.png"
+    fig.savefig(tmp)
+    os.replace(tmp, path)
 
-def get_nn_activations(input_vec):
-    clf = joblib.load("difficulty_classifier.pkl") # Use your adjuster model file
-    activations = []
-    X = np.array(input_vec).reshape(1, -1)
-    layer_input = X
+def render_surface_async(clf):
+    # Redraw the surface in the background, only if the adjuster model file
+    # is newer than the last rendered PNG
+    if os.path.exists(SURFACE_PATH) and os.path.getmtime(SURFACE_PATH) >= os.path.getmtime(ADJUSTER_PATH):
+        return None
+    thread = threading.Thread(target=plot_nn_decision_surface, args=(clf,), daemon=True)
+    thread.start()
+    return thread
 
-    # Input layer
-    activations.append(layer_input[0].tolist())
-
-    # Hidden layers and output
-    for i in range(len(clf.coefs_)):
-        layer_output = np.dot(layer_input, clf.coefs_[i]) + clf.intercepts_[i]
-        # Apply activation function
-        if clf.activation == 'relu':
-            layer_output = np.maximum(0, layer_output)
-        elif clf.activation == 'tanh':
-            layer_output = np.tanh(layer_output)
-        elif clf.activation == 'logistic':
-            layer_output = 1 / (1 + np.exp(-layer_output))
-        activations.append(layer_output[0].tolist())
-        layer_input = layer_output
-    return activations
+def get_nn_activations(input_vec):
+    # Per-layer activations of the puzzle classifier, input layer first
+    from inference import classify_batch
+    _, _, activations = classify_batch([input_vec], return_activations=True)
+    return [layer[0].tolist() for layer in activations]
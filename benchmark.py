@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# Benchmarks for the solver, rater, classifiers, storage and UI. Puzzles come
+# from fixed seeds and are cached in CORPUS_PATH, so runs stay comparable
+# across changes to the generator. Everything that touches disk runs against
+# throwaway databases and model files in a temporary directory.
+#
+#   python benchmark.py --output data/bench.json
+#   python benchmark.py --compare data/bench.json   # exit code 1 on regressions
+
+SEED = 1234
+CORPUS_PATH = "data/benchmark_corpus.json"
+CORPUS_LABELS = ["Easy", "Medium", "Expert"]
+OUTPUT_PATH = "data/benchmark.json"
+THRESHOLD = 0.25  # Relative slowdown of a median that counts as a regression...
+MIN_DELTA_MS = 0.02  # ...if it is also at least this large
+ROUNDS = 5  # Passes over a fixed corpus; each item keeps its fastest time
+
+SIZES = {  # Calls per benchmark: (full run, --quick)
+    "corpus": (60, 15),
+    "generate_full_grid": (300, 50),
+    "remove_numbers": (300, 50),
+    "save_action": (20000, 2000),
+    "suggest_games": (200, 50),
+    "ui_frames": (300, 60),
+}
+
+def _summary(times_ms):
+    times = sorted(times_ms)
+    n = len(times)
+    total = sum(times)
+    return {
+        "n": n,
+        "mean_ms": total / n,
+        "median_ms": times[n // 2],
+        "p95_ms": times[min(n - 1, int(n * 0.95))],
+        "max_ms": times[-1],
+        "ops_per_s": n / (total / 1000) if total else float("inf"),
+    }
+
+def _time_each(fn, items, rounds=1):
+    # Per-call times; with rounds > 1 the items are timed that many times and
+    # the fastest time of each is kept, which filters scheduler noise
+    items = list(items)
+    best = [float("inf")] * len(items)
+    for _ in range(rounds):
+        for i, item in enumerate(items):
+            start = time.perf_counter()
+            fn(item)
+            best[i] = min(best[i], (time.perf_counter() - start) * 1000)
+    return _summary(best)
+
+def load_corpus(size, seed=SEED, path=CORPUS_PATH):
+    # {label: [81-char puzzle strings]}, generated once per (seed, size)
+    try:
+        with open(path) as f:
+            corpus = json.load(f)
+        if corpus["seed"] == seed and corpus["size"] == size:
+            return corpus["puzzles"]
+    except (OSError, ValueError, KeyError):
+        pass
+    from solver import generate_puzzle
+    rng = random.Random(seed)
+    puzzles = {}
+    for label in CORPUS_LABELS:
+        puzzles[label] = []
+        while len(puzzles[label]) < size:
+            puzzle, _ = generate_puzzle(label, budget_ms=None, rng=rng)
+            puzzles[label].append("".join(map(str, puzzle.cells)))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"seed": seed, "size": size, "puzzles": puzzles}, f)
+    return puzzles
+
+def _grid(text):
+    return [[int(ch) for ch in text[i*9:(i+1)*9]] for i in range(9)]
+
+def bench_generate_full_grid(n, seed):
+    from solver import generate_full_grid
+    rng = random.Random(seed)
+    return _time_each(lambda _: generate_full_grid(rng), range(n))
+
+def bench_remove_numbers(n, seed):
+    from solver import generate_full_grid, remove_numbers
+    rng = random.Random(seed)
+    grids = [generate_full_grid(rng) for _ in range(n)]
+    random.seed(seed)
+    return _time_each(lambda g: remove_numbers(g, attempts=30, unique=True), grids)
+
+def bench_solve(grids):
+    from solver import solve
+    return _time_each(lambda g: solve([list(row) for row in g]), grids, ROUNDS)
+
+def bench_logical_solve(grids):
+    from solver import logical_solve
+    return _time_each(logical_solve, grids, ROUNDS)
+
+def bench_rate(grids):
+    from solver import rate
+    return _time_each(rate, grids, ROUNDS)
+
+def bench_extract_features(grids):
+    # Cold: the analysis cache is emptied before each call, otherwise every
+    # round after the first would only time a cache lookup
+    from solver import clear_analysis_cache, extract_features
+    def cold(g):
+        clear_analysis_cache()
+        return extract_features(g)
+    results = {"extract_features": _time_each(cold, grids, ROUNDS)}
+    results["analyze_cached"] = _time_each(extract_features, grids, ROUNDS)
+    return results
+
+def bench_canonical(grids):
+    from solver import canonical_form, symmetry_hashes
+    results = {"canonical_form": _time_each(canonical_form, grids, ROUNDS)}
+    batch = _time_each(symmetry_hashes, [grids] * 20, ROUNDS)
+    batch["rows_per_s"] = batch["ops_per_s"] * len(grids)
+    results["symmetry_hashes"] = batch
+    return results
+
+def _benchmark_classifier(grids, tmp):
+    # Small fixed-seed classifier trained on the corpus, so the benchmark does
+    # not depend on whatever model happens to be installed
+    from sklearn.neural_network import MLPClassifier
+    from inference import export_npz
+    from solver import FEATURE_SCHEMA, rate_puzzle
+    rows = [rate_puzzle(g) for g in grids]
+    clf = MLPClassifier(hidden_layer_sizes=(10, 10), max_iter=300, random_state=0)
+    clf.fit([f for f, _ in rows], [label for _, label in rows])
+    path = os.path.join(tmp, "classifier.npz")
+    export_npz(clf, path, feature_schema=FEATURE_SCHEMA)
+    return path
+
+def bench_classify_difficulty_nn(grids, tmp):
+    import inference
+    from solver import classify_difficulty_nn, extract_features
+    inference.CLASSIFIER_NPZ = _benchmark_classifier(grids, tmp)
+    classify_difficulty_nn(grids[0])  # Load the model outside the timing
+    results = {"classify_difficulty_nn": _time_each(classify_difficulty_nn, grids, ROUNDS)}
+    features = [extract_features(g) for g in grids]
+    batch = _time_each(inference.classify_batch, [features] * 20, ROUNDS)
+    batch["rows_per_s"] = batch["ops_per_s"] * len(features)
+    results["classify_batch"] = batch
+    return results
+
+def bench_suggest_difficulty(games, seed, tmp):
+    import adjuster
+    import tracking
+    tracking.DB_PATH = adjuster.DB_PATH = os.path.join(tmp, "suggest.db")
+    adjuster.ADJUSTER_PATH = os.path.join(tmp, "adjuster.pkl")
+    adjuster.ADJUSTER_NPZ = os.path.join(tmp, "adjuster.npz")
+    adjuster.PLOT_SURFACE = False
+    tracking.init_db()
+    rng = random.Random(seed)
+    history = [(rng.choice(list(adjuster.diff_map)), rng.uniform(20, 200), rng.randint(0, 6))
+               for _ in range(games)]
+    for game in history[:-10]:
+        tracking.save_performance(*game)
+    start = time.perf_counter()
+    adjuster.update_adjuster()
+    bootstrap_ms = (time.perf_counter() - start) * 1000
+    for game in history[-10:]:
+        tracking.save_performance(*game)
+    start = time.perf_counter()
+    adjuster.update_adjuster()
+    update_ms = (time.perf_counter() - start) * 1000
+    queries = [history[i % len(history)] for i in range(200)]
+    results = {"suggest_difficulty": _time_each(lambda q: adjuster.suggest_difficulty(*q, update=False), queries)}
+    results["update_adjuster"] = {"bootstrap_ms": bootstrap_ms, "median_ms": update_ms, "n": 1}
+    return results
+
+def bench_save_action(n, seed, tmp):
+    # Enqueue cost as seen by the UI thread, plus end-to-end throughput
+    # including the final flush
+    import tracking
+    tracking.DB_PATH = os.path.join(tmp, "actions.db")
+    tracking.init_db()
+    tracking.init_actions_db()
+    logger = tracking.ActionLogger()
+    rng = random.Random(seed)
+    moves = [(rng.randrange(9), rng.randrange(9), rng.randint(1, 9), rng.random() * 5, rng.random() < 0.1)
+             for _ in range(n)]
+    start = time.perf_counter()
+    result = _time_each(lambda m: logger.log(*m), moves)
+    logger.flush()
+    elapsed = time.perf_counter() - start
+    logger.close()
+    result["moves_per_s"] = n / elapsed
+    result["flushes"] = logger.stats()["flushes"]
+    return result
+
+def bench_live_move(grids, seed):
+    # One player move as the UI handles it: update the live analyzer, then
+    # recompute the remaining puzzle's features. Boards differ after every
+    # move, so the analysis cache does not help.
+    from live import LiveAnalyzer
+    from puzzle import Puzzle
+    rng = random.Random(seed)
+    moves = []
+    for grid in grids:
+        puzzle = Puzzle(grid)
+        live = LiveAnalyzer(puzzle, puzzle.solution)
+        empty = [(i, j) for i in range(9) for j in range(9) if not grid[i][j]]
+        rng.shuffle(empty)
+        moves += [(live, i, j, puzzle.solution[i][j]) for i, j in empty]
+
+    def move(m):
+        live, i, j, digit = m
+        live.place(i, j, digit)
+        live.features()
+    return _time_each(move, moves)
+
+def bench_ui_frames(grid, frames):
+    from ui import frame_benchmark
+    result = frame_benchmark(grid, frames=frames)
+    result["n"] = result.pop("frames")
+    return result
+
+def run(quick=False, only=None, seed=SEED):
+    def size(name):
+        return SIZES[name][1 if quick else 0]
+
+    corpus = load_corpus(size("corpus"), seed)
+    grids = [_grid(p) for label in CORPUS_LABELS for p in corpus[label]]
+    tmp = tempfile.mkdtemp(prefix="sudoku-bench-")
+    benches = [
+        ("generate_full_grid", lambda: bench_generate_full_grid(size("generate_full_grid"), seed)),
+        ("remove_numbers", lambda: bench_remove_numbers(size("remove_numbers"), seed)),
+        ("solve", lambda: bench_solve(grids)),
+        ("logical_solve", lambda: bench_logical_solve(grids)),
+        ("rate", lambda: bench_rate(grids)),
+        ("extract_features", lambda: bench_extract_features(grids)),
+        ("canonical_form", lambda: bench_canonical(grids)),
+        ("classify_difficulty_nn", lambda: bench_classify_difficulty_nn(grids, tmp)),
+        ("suggest_difficulty", lambda: bench_suggest_difficulty(size("suggest_games"), seed, tmp)),
+        ("save_action", lambda: bench_save_action(size("save_action"), seed, tmp)),
+        ("live_move", lambda: bench_live_move(grids, seed)),
+        ("ui_frame", lambda: bench_ui_frames(_grid(corpus["Medium"][0]), size("ui_frames"))),
+    ]
+    results, skipped = {}, {}
+    try:
+        for name, bench in benches:
+            if only and name not in only:
+                continue
+            print(f"{name}...", file=sys.stderr, flush=True)
+            try:
+                result = bench()
+            except ImportError as exc:
+                skipped[name] = f"missing dependency: {exc.name}"
+                continue
+            if "n" in result:
+                results[name] = result
+            else:
+                results.update(result)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "meta": {
+            "seed": seed,
+            "quick": quick,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": time.time(),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+def compare(current, baseline, threshold=THRESHOLD):
+    # Benchmarks whose median got more than threshold slower than baseline
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        slower = result["median_ms"] - base["median_ms"] >= MIN_DELTA_MS
+        flag = "REGRESSION" if ratio > 1 + threshold and slower else ""
+        print(f"{name:24} {base['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms  x{ratio:5.2f}  {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def print_results(report):
+    for name, result in report["results"].items():
+        line = f"{name:24} median {result['median_ms']:10.3f} ms"
+        if "p95_ms" in result:
+            line += f"  p95 {result['p95_ms']:10.3f} ms"
+        print(line)
+    for name, reason in report["skipped"].items():
+        print(f"{name:24} skipped ({reason})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Sudoku benchmark suite.")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored result file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed relative slowdown, e.g. 0.25")
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller corpora, for a fast sanity check")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    report = run(quick=args.quick, only=args.only, seed=args.seed)
+    print_results(report)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
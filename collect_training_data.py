@@ -1,15 +1,261 @@
+import argparse
 import csv
-from solver import generate_full_grid, remove_numbers, extract_features, classify_difficulty
+import json
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import dataset
+from puzzle import Puzzle
+from puzzle_index import PuzzleIndex, log_puzzles
+from solver import generate_full_grid, remove_numbers, DIFFICULTIES, FEATURE_NAMES, FEATURE_SCHEMA
 
 NUM_SAMPLES = 200  # You can increase this for more data
+DATA_PATH = "sudoku_difficulty_data.csv"
+TASK_SIZE = 256    # Puzzles generated per worker task
+CHUNK_ROWS = 4096  # Rows buffered in memory before they are appended to disk
+STALL_TASKS = 50   # A target label still missing after this many tasks without one is given up
+HARD_MIN_BLANKS = 61  # Hard needs more than 60 singles steps (solver.difficulty_from_steps)
+
+def task_seed(seed, task):
+    # Independent RNG stream per task, so results do not depend on which
+    # worker ran the task or how many workers there are
+    return int(np.random.SeedSequence(seed, spawn_key=(task,)).generate_state(1)[0])
+
+def generate_batch(args):
+    # Rated Puzzles (features and label are computed here, in the worker)
+    seed, task, size, attempts = args
+    rng = random.Random(task_seed(seed, task))
+    puzzles = []
+    for _ in range(size):
+        full_grid = generate_full_grid(rng)
+        grid = remove_numbers(full_grid, attempts=rng.randint(*attempts), unique=True, rng=rng)
+        puzzle = Puzzle(grid, solution=full_grid)
+        puzzle.label  # Rate here; the analysis is pickled along with the Puzzle
+        puzzles.append(puzzle)
+    return puzzles
+
+def unreachable(label, attempts):
+    # Whether no puzzle blanking at most attempts[1] cells can get the label
+    return label == "Hard" and attempts[1] < HARD_MIN_BLANKS
+
+def _is_binary(path):
+    # Binary datasets (dataset.py) keep the puzzles; CSV keeps features only
+    return path.endswith(".bin")
+
+def _progress_path(path):
+    return path + ".progress"
+
+def _index_path(path):
+    # Log of the puzzles the dedupe index has seen (puzzle_index.PuzzleIndex)
+    return path + ".index"
+
+def _load_existing(path):
+    counts = dict.fromkeys(DIFFICULTIES, 0)
+    if not os.path.exists(path):
+        return counts
+    if _is_binary(path):
+        counts.update(dataset.label_counts(path))
+        return counts
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if row:
+                counts[row[-1]] = counts.get(row[-1], 0) + 1
+    return counts
+
+def _load_index(path):
+    # Puzzles earlier runs produced, so a resumed run does not repeat them.
+    # The index is kept in a log next to the output and memory-mapped, not
+    # rebuilt from the rows; a .bin dataset written before logs existed is
+    # logged block by block first.
+    index_path = _index_path(path)
+    if os.path.exists(path) and not os.path.exists(index_path):
+        if _is_binary(path):
+            for _, block in dataset.iter_blocks(path):
+                puzzles = block["puzzle"]
+                log_puzzles(index_path, puzzles[puzzles.any(axis=1)])
+        elif sum(_load_existing(path).values()):
+            print(f"{path} has no {index_path}; its rows cannot be checked for duplicates", file=sys.stderr)
+    return PuzzleIndex(index_path)
+
+def _feature_schema(path):
+    if _is_binary(path):
+        return dataset.read_header(path)["feature_schema"]
+    return dataset.csv_feature_schema(path)
+
+def _load_progress(path, seed):
+    try:
+        with open(_progress_path(path)) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if progress.get("seed") != seed:
+        return 0
+    return progress.get("next_task", 0)
+
+def _save_progress(path, seed, next_task):
+    tmp = _progress_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"seed": seed, "next_task": next_task, "feature_schema": FEATURE_SCHEMA}, f)
+    os.replace(tmp, _progress_path(path))
+
+def collect(path=DATA_PATH, num_samples=NUM_SAMPLES, targets=None, seed=0, workers=None,
+            attempts=(30, 30), resume=True, max_puzzles=None, dedupe=True):
+    # Generate and rate puzzles on a process pool, appending rows to path in
+    # chunks. targets maps label -> wanted row count; without it any label is
+    # kept until num_samples rows exist. With resume, rows already in path
+    # count towards the targets and generation continues after the last
+    # task that was written. workers=0 runs without a process pool. With
+    # dedupe, puzzles equivalent under the Sudoku symmetries to one already
+    # kept are dropped. Target labels the attempts range cannot reach are
+    # skipped, and one that gets no new row for STALL_TASKS tasks is given
+    # up, so the run always ends.
+    if not resume:
+        for p in (path, _progress_path(path), _index_path(path)):
+            if os.path.exists(p):
+                os.remove(p)
+    if os.path.exists(path) and not _is_binary(path) and not os.path.exists(_progress_path(path)):
+        # Nothing tells which tasks or features the rows came from, so
+        # resuming would append duplicates
+        raise ValueError(f"{path} has no {_progress_path(path)} to resume from; start it again with --fresh")
+    if os.path.exists(path) and _feature_schema(path) != FEATURE_SCHEMA:
+        raise ValueError(f"{path} was rated with feature schema {_feature_schema(path)}, not "
+                         f"{FEATURE_SCHEMA}; start it again with --fresh")
+    counts = _load_existing(path)
+    next_task = _load_progress(path, seed) if resume else 0
+    if not os.path.exists(path):
+        if _is_binary(path):
+            dataset.create(path)
+        else:
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerow(FEATURE_NAMES + ["label"])
+            _save_progress(path, seed, next_task)  # Records the CSV's feature schema
+
+    given_up = set()
+    stalled = {}  # Target label -> tasks since it last got a row
+    if targets is not None:
+        for label in targets:
+            if unreachable(label, attempts):
+                given_up.add(label)
+                print(f"Skipping {label}: cannot be reached by blanking at most {attempts[1]} cells",
+                      file=sys.stderr)
+
+    def wanted(label):
+        if targets is not None:
+            return label not in given_up and counts.get(label, 0) < targets.get(label, 0)
+        return sum(counts.values()) < num_samples
+
+    def done():
+        if targets is not None:
+            return not any(wanted(label) for label in targets)
+        return sum(counts.values()) >= num_samples
+
+    index = _load_index(path) if dedupe else None
+    generated = duplicates = 0
+    start = time.time()
+    buffer = []
+
+    def flush(task):
+        if _is_binary(path):
+            dataset.append(path, dataset.records_from_puzzles(buffer))
+        else:
+            with open(path, "a", newline="") as f:
+                csv.writer(f).writerows(p.features + [p.label] for p in buffer)
+        buffer.clear()
+        # Rows, then the index, then the task count: a run interrupted in
+        # between regenerates tasks whose puzzles the index already drops
+        if index is not None:
+            index.save(_index_path(path))
+        _save_progress(path, seed, task)
+
+    def report():
+        rate = generated / max(time.time() - start, 1e-9)
+        summary = " ".join(f"{label}={counts.get(label, 0)}" for label in DIFFICULTIES)
+        print(f"\r{summary} | {generated} puzzles, {duplicates} duplicates, {rate:.0f}/s",
+              end="", file=sys.stderr, flush=True)
+
+    def tasks():
+        task = next_task
+        while True:
+            yield seed, task, TASK_SIZE, attempts
+            task += 1
+
+    def consume(results):
+        nonlocal task, generated, duplicates
+        for puzzles in results:
+            task += 1
+            generated += len(puzzles)
+            if index is not None:
+                new = index.add_many(puzzles)
+                duplicates += len(puzzles) - int(new.sum())
+                puzzles = [p for p, keep in zip(puzzles, new) if keep]
+            kept = set()
+            for puzzle in puzzles:
+                if wanted(puzzle.label):
+                    counts[puzzle.label] = counts.get(puzzle.label, 0) + 1
+                    buffer.append(puzzle)
+                    kept.add(puzzle.label)
+            if targets is not None:
+                for label in targets:
+                    stalled[label] = 0 if label in kept else stalled.get(label, 0) + 1
+                    if wanted(label) and stalled[label] >= STALL_TASKS:
+                        given_up.add(label)
+                        print(f"\nGiving up on {label}: none in the last {STALL_TASKS} tasks",
+                              file=sys.stderr)
+            finished = done() or (max_puzzles and generated >= max_puzzles)
+            if len(buffer) >= CHUNK_ROWS or finished:
+                flush(task)
+            report()
+            if finished:
+                return
+
+    task = next_task
+    if not done():
+        if workers == 0:
+            # In-process, e.g. from a background thread where forking is unsafe
+            consume(map(generate_batch, tasks()))
+        else:
+            with Pool(workers) as pool:
+                consume(pool.imap(generate_batch, tasks()))
+                pool.terminate()
+        if buffer:
+            flush(task)
+        print(file=sys.stderr)
+    return counts
+
+def _parse_attempts(text):
+    low, _, high = text.partition("-")
+    return int(low), int(high or low)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate rated Sudoku puzzles for classifier training.")
+    parser.add_argument("--output", default=DATA_PATH, help="CSV, or a .bin dataset that also keeps the puzzles")
+    parser.add_argument("--samples", type=int, default=NUM_SAMPLES, help="total rows when no per-label target is given")
+    parser.add_argument("--per-label", type=int, help="rows wanted for every difficulty label")
+    parser.add_argument("--target", action="append", default=[], metavar="LABEL=N", help="rows wanted for one label")
+    parser.add_argument("--attempts", type=_parse_attempts, default=(30, 30), help="cells to blank, e.g. 30 or 30-60")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-puzzles", type=int, default=None, help="stop after generating this many puzzles")
+    parser.add_argument("--fresh", action="store_true", help="discard existing output instead of resuming")
+    parser.add_argument("--keep-duplicates", action="store_true", help="keep puzzles equivalent under symmetry")
+    args = parser.parse_args()
 
-with open("sudoku_difficulty_data.csv", "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["num_clues", "naked_single", "hidden_single", "naked_pair", "pointing_pair", "label"])
-    for _ in range(NUM_SAMPLES):
-        full_grid = generate_full_grid()
-        puzzle = remove_numbers(full_grid, attempts=30)
-        features = extract_features(puzzle)
-        label = classify_difficulty(puzzle)  # Use your current logic-based classifier for labeling
-        writer.writerow(features + [label])
-print("Data collection complete.")
\ No newline at end of file
+    targets = None
+    if args.per_label is not None:
+        targets = dict.fromkeys(DIFFICULTIES, args.per_label)
+    if args.target:
+        targets = targets or {}
+        for item in args.target:
+            label, _, n = item.partition("=")
+            targets[label] = int(n)
+    collect(args.output, args.samples, targets, args.seed, args.workers,
+            args.attempts, resume=not args.fresh, max_puzzles=args.max_puzzles,
+            dedupe=not args.keep_duplicates)
+    print("Data collection complete.")
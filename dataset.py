@@ -0,0 +1,259 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from solver import DIFFICULTIES, FEATURE_NAMES, FEATURE_SCHEMA
+
+# Append-only binary dataset of rated puzzles. A HEADER_SIZE-byte header
+# (MAGIC plus JSON metadata) is followed by fixed-size records:
+#
+#   puzzle    81 x u1   row-major, 0 = blank (all zero if unknown)
+#   solution  81 x u1   (all zero if unknown)
+#   features  n x f4    named in the header
+#   label     u1        index into the header's labels, UNKNOWN_LABEL if none
+#
+# open_dataset() maps the records with np.memmap, so slices are views into
+# the file and only the pages touched are read. The header also records the
+# solver.FEATURE_SCHEMA the features were computed with (1 when missing).
+
+MAGIC = b"SUDOKUDS"
+VERSION = 1
+HEADER_SIZE = 512
+DATASET_PATH = "sudoku_difficulty_data.bin"
+UNKNOWN_LABEL = 255
+CHUNK_RECORDS = 65536  # Records per chunk for conversion and recomputation
+
+def record_dtype(n_features=len(FEATURE_NAMES)):
+    return np.dtype([
+        ("puzzle", "u1", (81,)),
+        ("solution", "u1", (81,)),
+        ("features", "<f4", (n_features,)),
+        ("label", "u1"),
+    ])
+
+def create(path, feature_names=FEATURE_NAMES, labels=DIFFICULTIES, feature_schema=FEATURE_SCHEMA):
+    # Start an empty dataset (replacing any file at path)
+    with open(path, "wb") as f:
+        f.write(_header(feature_names, labels, feature_schema))
+
+def _header(feature_names, labels, feature_schema):
+    meta = json.dumps({"version": VERSION, "features": list(feature_names), "labels": list(labels),
+                       "feature_schema": feature_schema}).encode()
+    if len(MAGIC) + 4 + len(meta) > HEADER_SIZE:
+        raise ValueError("dataset metadata does not fit in the header")
+    return (MAGIC + len(meta).to_bytes(4, "little") + meta).ljust(HEADER_SIZE, b"\0")
+
+def csv_feature_schema(csv_path):
+    # A training CSV has no header of its own; collect_training_data records
+    # the schema in its .progress file. CSVs without one predate versioning.
+    try:
+        with open(csv_path + ".progress") as f:
+            return json.load(f).get("feature_schema", 1)
+    except (OSError, ValueError):
+        return 1
+
+def read_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not a puzzle dataset")
+    size = int.from_bytes(header[len(MAGIC):len(MAGIC) + 4], "little")
+    meta = json.loads(header[len(MAGIC) + 4:len(MAGIC) + 4 + size])
+    if meta["version"] > VERSION:
+        raise ValueError(f"{path} uses dataset version {meta['version']}, newer than {VERSION}")
+    meta.setdefault("feature_schema", 1)
+    meta["dtype"] = record_dtype(len(meta["features"]))
+    return meta
+
+def _record_count(path, dtype):
+    return (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+
+def open_dataset(path, mode="r"):
+    # Structured memmap of the records (mode "r" or "r+"); a partial record
+    # left by an interrupted append is not included
+    meta = read_header(path)
+    n = _record_count(path, meta["dtype"])
+    if n == 0:
+        return np.zeros(0, dtype=meta["dtype"])
+    return np.memmap(path, dtype=meta["dtype"], mode=mode, offset=HEADER_SIZE, shape=(n,))
+
+def iter_blocks(path, chunk=CHUNK_RECORDS, mode="r", start=0, stop=None):
+    # (offset, memmap) for consecutive blocks of at most chunk records. Each
+    # block is mapped on its own and released once the caller moves on, so
+    # resident memory stays at about one block however large the file is.
+    meta = read_header(path)
+    dtype = meta["dtype"]
+    n = _record_count(path, dtype)
+    stop = n if stop is None else min(stop, n)
+    for lo in range(start, stop, chunk):
+        k = min(chunk, stop - lo)
+        yield lo, np.memmap(path, dtype=dtype, mode=mode, offset=HEADER_SIZE + lo * dtype.itemsize, shape=(k,))
+
+def append(path, records):
+    # Append a structured array with this dataset's dtype
+    meta = read_header(path)
+    records = np.asarray(records, dtype=meta["dtype"])
+    n = _record_count(path, meta["dtype"])
+    with open(path, "r+b") as f:
+        f.truncate(HEADER_SIZE + n * meta["dtype"].itemsize)
+        f.seek(0, os.SEEK_END)
+        f.write(records.tobytes())
+    return n + len(records)
+
+def records_from_puzzles(puzzles, feature_names=FEATURE_NAMES, labels=DIFFICULTIES):
+    # Puzzle objects -> records, rating each puzzle once
+    dtype = record_dtype(len(feature_names))
+    records = np.zeros(len(puzzles), dtype=dtype)
+    codes = {label: i for i, label in enumerate(labels)}
+    for i, puzzle in enumerate(puzzles):
+        records["puzzle"][i] = np.frombuffer(puzzle.cells, dtype=np.uint8)
+        records["solution"][i] = np.frombuffer(puzzle.solution.cells, dtype=np.uint8)
+        records["features"][i] = features_for(puzzle, feature_names)
+        records["label"][i] = codes.get(puzzle.label, UNKNOWN_LABEL)
+    return records
+
+def features_for(puzzle, feature_names=FEATURE_NAMES):
+    # Any mix of num_clues and solver.rate step counts, by name
+    values = dict(puzzle.steps, num_clues=puzzle.clues)
+    return [values[name] for name in feature_names]
+
+def from_csv(csv_path, path, chunk=CHUNK_RECORDS):
+    # Convert a collect_training_data CSV. The CSV has no puzzles, so those
+    # records carry zero puzzle and solution cells and cannot be re-rated;
+    # a CSV rated with an older feature schema is therefore refused.
+    feature_schema = csv_feature_schema(csv_path)
+    if feature_schema != FEATURE_SCHEMA:
+        raise ValueError(f"{csv_path} uses feature schema {feature_schema}, not {FEATURE_SCHEMA}; "
+                         "collect it again (CSVs keep no puzzles to re-rate)")
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        feature_names = columns[:-1]
+        create(path, feature_names)
+        codes = {label: i for i, label in enumerate(DIFFICULTIES)}
+        dtype = record_dtype(len(feature_names))
+        total = 0
+        while True:
+            rows = [row for _, row in zip(range(chunk), reader) if row]
+            if not rows:
+                break
+            records = np.zeros(len(rows), dtype=dtype)
+            records["features"] = [[float(v) for v in row[:-1]] for row in rows]
+            records["label"] = [codes.get(row[-1], UNKNOWN_LABEL) for row in rows]
+            total = append(path, records)
+    return total
+
+def _recompute_range(args):
+    src, dst, start, stop, feature_names = args
+    from puzzle import Puzzle
+    labels = {label: i for i, label in enumerate(read_header(dst)["labels"])}
+    blocks = zip(iter_blocks(src, 1024, start=start, stop=stop),
+                 iter_blocks(dst, 1024, "r+", start=start, stop=stop))
+    for (_, block), (_, out) in blocks:
+        for i in range(len(block)):
+            cells = block["puzzle"][i].tobytes()
+            if not any(cells):
+                out["label"][i] = block["label"][i]
+                continue
+            solution = block["solution"][i].tobytes()
+            puzzle = Puzzle(cells, solution=solution if any(solution) else None)
+            out["features"][i] = features_for(puzzle, feature_names)
+            out["label"][i] = labels.get(puzzle.label, UNKNOWN_LABEL)
+        out.flush()
+    return stop - start
+
+def recompute_features(path, out_path=None, feature_names=None, workers=None, chunk=CHUNK_RECORDS):
+    # Re-rate every stored puzzle, chunk by chunk through memmaps. With
+    # out_path (required when the feature list changes) the result goes to
+    # a new dataset; otherwise features and labels are rewritten in place.
+    # Either way the result is marked with the current FEATURE_SCHEMA.
+    meta = read_header(path)
+    feature_names = list(feature_names or meta["features"])
+    if out_path is None:
+        if feature_names != meta["features"]:
+            raise ValueError("a different feature list needs out_path")
+        out_path = path
+    else:
+        create(out_path, feature_names, meta["labels"])
+        dtype = record_dtype(len(feature_names))
+        for _, block in iter_blocks(path, chunk):
+            records = np.zeros(len(block), dtype=dtype)
+            records["puzzle"] = block["puzzle"]
+            records["solution"] = block["solution"]
+            append(out_path, records)
+    n = _record_count(out_path, read_header(out_path)["dtype"])
+    tasks = [(path, out_path, lo, min(n, lo + chunk), feature_names) for lo in range(0, n, chunk)]
+    if workers == 0:
+        done = sum(map(_recompute_range, tasks))
+    else:
+        with Pool(workers) as pool:
+            done = sum(pool.imap_unordered(_recompute_range, tasks))
+    if out_path == path:
+        with open(path, "r+b") as f:
+            f.write(_header(feature_names, meta["labels"], FEATURE_SCHEMA))
+    return done
+
+def dedupe(path, out_path, chunk=CHUNK_RECORDS):
+    # Copy path to out_path without puzzles equivalent under the Sudoku
+    # symmetries to an earlier one; records without a puzzle are kept.
+    # Returns (records kept, records dropped).
+    from puzzle_index import PuzzleIndex
+    meta = read_header(path)
+    create(out_path, meta["features"], meta["labels"], meta["feature_schema"])
+    index = PuzzleIndex()
+    kept = dropped = 0
+    for _, block in iter_blocks(path, chunk):
+        keep = ~block["puzzle"].any(axis=1)
+        keep[~keep] = index.add_many(block["puzzle"][~keep])
+        append(out_path, block[keep])
+        kept += int(keep.sum())
+        dropped += len(block) - int(keep.sum())
+    return kept, dropped
+
+def label_counts(path):
+    labels = read_header(path)["labels"]
+    counts = dict.fromkeys(labels, 0)
+    for _, block in iter_blocks(path):
+        codes, n = np.unique(block["label"], return_counts=True)
+        for code, k in zip(codes, n):
+            if code < len(labels):
+                counts[labels[code]] += int(k)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, convert and re-rate puzzle datasets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info", help="print the header and label counts")
+    p.add_argument("path")
+    p = sub.add_parser("convert", help="convert a training CSV")
+    p.add_argument("csv")
+    p.add_argument("path")
+    p = sub.add_parser("recompute", help="re-rate every stored puzzle")
+    p.add_argument("path")
+    p.add_argument("--output", help="write to a new dataset (needed with --features)")
+    p.add_argument("--features", nargs="+", help="feature names, e.g. num_clues naked_single x_wing")
+    p.add_argument("--workers", type=int, default=None)
+    p = sub.add_parser("dedupe", help="copy without puzzles that are equivalent under symmetry")
+    p.add_argument("path")
+    p.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        meta = read_header(args.path)
+        print(f"{args.path}: {len(open_dataset(args.path))} records of {meta['dtype'].itemsize} bytes")
+        print("features:", ", ".join(meta["features"]), f"(schema {meta['feature_schema']})")
+        for label, n in label_counts(args.path).items():
+            print(f"  {label}: {n}")
+    elif args.command == "convert":
+        print(f"{from_csv(args.csv, args.path)} records written to {args.path}")
+    elif args.command == "recompute":
+        n = recompute_features(args.path, args.output, args.features, args.workers)
+        print(f"{n} records re-rated", file=sys.stderr)
+    elif args.command == "dedupe":
+        kept, dropped = dedupe(args.path, args.output)
+        print(f"{kept} records written to {args.output}, {dropped} duplicates dropped")
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+from models import get_model
+
+CLASSIFIER_NPZ = "difficulty_classifier.npz"
+
+def export_npz(clf, path=CLASSIFIER_NPZ, **extra):
+    # Write the weights of a fitted MLPClassifier to a compact .npz file;
+    # extra keyword arrays are stored alongside and returned by load_npz
+    arrays = {
+        "activation": np.array(clf.activation),
+        "out_activation": np.array(clf.out_activation_),
+        "classes": np.asarray(clf.classes_),
+    }
+    for i, (coef, intercept) in enumerate(zip(clf.coefs_, clf.intercepts_)):
+        arrays[f"coef_{i}"] = coef
+        arrays[f"intercept_{i}"] = intercept
+    for key, value in extra.items():
+        arrays[f"extra_{key}"] = np.asarray(value)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+def classifier_current(path=CLASSIFIER_NPZ):
+    # Whether the weights at path exist and were trained on features with the
+    # solver's current FEATURE_SCHEMA (weights without one predate it)
+    from solver import FEATURE_SCHEMA
+    if not os.path.exists(path):
+        return False
+    extra = get_model(path, loader=load_npz)["extra"]
+    return int(extra.get("feature_schema", 1)) == FEATURE_SCHEMA
+
+def load_npz(path):
+    with np.load(path, allow_pickle=False) as data:
+        n_layers = sum(1 for key in data.files if key.startswith("coef_"))
+        return {
+            "activation": str(data["activation"]),
+            "out_activation": str(data["out_activation"]),
+            "classes": data["classes"],
+            "coefs": [data[f"coef_{i}"] for i in range(n_layers)],
+            "intercepts": [data[f"intercept_{i}"] for i in range(n_layers)],
+            "extra": {key[6:]: data[key] for key in data.files if key.startswith("extra_")},
+        }
+
+def _logistic(x):
+    try:
+        from scipy.special import expit
+    except ImportError:
+        return 1.0 / (1.0 + np.exp(-x))
+    return expit(x)
+
+def _softmax(x):
+    x = x - x.max(axis=1)[:, np.newaxis]
+    np.exp(x, out=x)
+    x /= x.sum(axis=1)[:, np.newaxis]
+    return x
+
+ACTIVATIONS = {
+    "identity": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "logistic": _logistic,
+    "softmax": _softmax,
+}
+
+def classify_batch(features, model=None, return_activations=False):
+    # Forward pass over a (n, n_features) array, same arithmetic as
+    # MLPClassifier.predict/predict_proba. Returns (labels, probabilities) or
+    # (labels, probabilities, activations) with one (n, width) array per layer,
+    # input layer first.
+    if model is None:
+        model = get_model(CLASSIFIER_NPZ, loader=load_npz)
+    x = np.asarray(features, dtype=np.float64)
+    if x.ndim == 1:
+        x = x.reshape(1, -1)
+    activations = [x]
+    hidden = ACTIVATIONS[model["activation"]]
+    last = len(model["coefs"]) - 1
+    for i, (coef, intercept) in enumerate(zip(model["coefs"], model["intercepts"])):
+        x = x @ coef + intercept
+        x = hidden(x) if i != last else ACTIVATIONS[model["out_activation"]](x)
+        activations.append(x)
+    classes = model["classes"]
+    if x.shape[1] == 1:
+        # Binary problem: one logistic output for the second class
+        labels = classes[(x.ravel() > 0.5).astype(int)]
+        probabilities = np.hstack([1 - x, x])
+    else:
+        labels = classes[np.argmax(x, axis=1)]
+        probabilities = x
+    if return_activations:
+        return labels, probabilities, activations
+    return labels, probabilities
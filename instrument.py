@@ -0,0 +1,170 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+# Timing spans and counters for the game pipeline, off unless enabled with
+# `python main.py --trace[=PATH]` or SUDOKU_TRACE=PATH. PATH is a JSON-lines
+# file, or "db" for the trace_events table of the tracking database; without
+# one, events go to TRACE_PATH.
+#
+# When disabled, span() returns a shared no-op context manager and count()
+# returns at once; hot loops guard their bookkeeping with `if instrument.ACTIVE`.
+# Counters are summed in memory and written once, at flush() or exit.
+
+TRACE_PATH = "data/trace.jsonl"
+FLUSH_EVENTS = 512  # Write spans out once this many are buffered
+
+ACTIVE = False
+
+_sink = None
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class _Span:
+    __slots__ = ("name", "attrs", "parent", "start", "_t0")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = (time.perf_counter() - self._t0) * 1000
+        _local.stack.pop()
+        event = {"kind": "span", "name": self.name, "start": self.start, "duration_ms": duration,
+                 "parent": self.parent, "thread": threading.current_thread().name}
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if self.attrs:
+            event["attrs"] = self.attrs
+        with _lock:
+            _events.append(event)
+            full = len(_events) >= FLUSH_EVENTS
+        if full:
+            _write_spans()
+        return False
+
+    def set(self, **attrs):
+        # Attach attributes known only once the span is running
+        self.attrs.update(attrs)
+
+def enabled():
+    return ACTIVE
+
+def enable(sink=None):
+    # Start recording; sink is a JSON-lines path or "db"
+    global ACTIVE, _sink
+    _sink = sink or TRACE_PATH
+    if not ACTIVE:
+        ACTIVE = True
+        atexit.register(flush)
+
+def disable():
+    global ACTIVE
+    flush()
+    ACTIVE = False
+
+def enable_if_requested(argv=None):
+    argv = sys.argv if argv is None else argv
+    for arg in argv[1:]:
+        if arg == "--trace" or arg.startswith("--trace="):
+            enable(arg.partition("=")[2] or None)
+            return
+    if os.environ.get("SUDOKU_TRACE"):
+        enable(os.environ["SUDOKU_TRACE"])
+
+def span(name, **attrs):
+    # with instrument.span("generation", difficulty=d): ...
+    if not ACTIVE:
+        return _NO_SPAN
+    return _Span(name, attrs)
+
+def record(name, duration_ms, **attrs):
+    # A span measured by the caller, for stages that do not fit a with-block
+    if not ACTIVE:
+        return
+    event = {"kind": "span", "name": name, "start": time.time() - duration_ms / 1000,
+             "duration_ms": duration_ms, "parent": None, "thread": threading.current_thread().name}
+    if attrs:
+        event["attrs"] = attrs
+    with _lock:
+        _events.append(event)
+
+def count(name, n=1):
+    if not ACTIVE:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def count_many(counts, prefix=""):
+    # Add every value of a dict, e.g. a solver stats or steps dict
+    if not ACTIVE:
+        return
+    with _lock:
+        for name, n in counts.items():
+            key = prefix + name
+            _counters[key] = _counters.get(key, 0) + n
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+def _take(with_counters):
+    global _events
+    with _lock:
+        events, _events = _events, []
+        if with_counters and _counters:
+            now = time.time()
+            events += [{"kind": "counter", "name": name, "start": now, "value": value}
+                       for name, value in sorted(_counters.items())]
+            _counters.clear()
+    return events
+
+def _write(events):
+    if not events:
+        return
+    if _sink == "db":
+        import tracking
+        tracking.migrate()
+        tracking.save_trace_events(events)
+        return
+    os.makedirs(os.path.dirname(_sink) or ".", exist_ok=True)
+    with open(_sink, "a") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+def _write_spans():
+    _write(_take(with_counters=False))
+
+def flush():
+    # Write buffered spans and the counter totals since the last flush
+    if _sink is not None:
+        _write(_take(with_counters=True))
@@ -0,0 +1,171 @@
+import time
+
+import instrument
+from puzzle import Puzzle
+from solver import (CELL_UNITS, PEERS, POPCOUNT, TECHNIQUES, UNITS, CandidateState, analyze)
+
+# Incremental analysis of the board during play. LiveAnalyzer keeps a
+# CandidateState for the current grid (givens plus the player's entries) and
+# updates it on every placement and deletion instead of rebuilding it:
+# placing a digit costs one CandidateState.place, deleting one re-derives the
+# candidates of the cell and its 20 peers from per-unit digit counts. The
+# next logical step, the classifier features of the remaining puzzle and the
+# classifier activations are computed from that state on demand, once per
+# board, through solver.analyze's cache.
+
+UNIT_NAMES = ["row", "column", "box"]
+
+def _cell_name(idx):
+    return f"r{idx // 9 + 1}c{idx % 9 + 1}"
+
+class LiveAnalyzer:
+    def __init__(self, puzzle, solution=None):
+        puzzle = Puzzle.of(puzzle)
+        self.givens = puzzle.cells
+        self.solution = solution.cells if solution is not None else None
+        self.state = CandidateState(puzzle)
+        # placed[u][d]: cells of unit u holding digit d+1 (more than one only
+        # while the player has a conflicting entry)
+        self.placed = [[0] * 9 for _ in range(27)]
+        for idx, v in enumerate(self.state.cells):
+            if v:
+                for u in CELL_UNITS[idx]:
+                    self.placed[u][v - 1] += 1
+        self._cached = {}  # Results for the current board, cleared on every change
+        self.update_ms = 0.0  # Cost of the last place/delete
+
+    def _changed(self, start):
+        self._cached = {}
+        self.update_ms = (time.perf_counter() - start) * 1000
+        if instrument.ACTIVE:
+            instrument.count("live.updates")
+
+    def place(self, i, j, digit):
+        start = time.perf_counter()
+        idx = i*9 + j
+        if self.givens[idx]:
+            return
+        if self.state.cells[idx]:
+            if self.state.cells[idx] == digit:
+                return
+            self._remove(idx)
+        self.state.place(idx, digit)
+        for u in CELL_UNITS[idx]:
+            self.placed[u][digit - 1] += 1
+        self._changed(start)
+
+    def delete(self, i, j):
+        start = time.perf_counter()
+        idx = i*9 + j
+        if self.givens[idx] or not self.state.cells[idx]:
+            return
+        self._remove(idx)
+        self._changed(start)
+
+    def _allowed(self, idx):
+        # Digits no unit of idx holds
+        used = 0
+        for u in CELL_UNITS[idx]:
+            counts = self.placed[u]
+            for d in range(9):
+                if counts[d]:
+                    used |= 1 << d
+        return 0x1FF & ~used
+
+    def _remove(self, idx):
+        state = self.state
+        digit = state.cells[idx]
+        for u in CELL_UNITS[idx]:
+            self.placed[u][digit - 1] -= 1
+        state.cells[idx] = 0
+        state.restore(idx, self._allowed(idx))
+        # The digit comes back to peers that no longer see it anywhere
+        bit = 1 << (digit - 1)
+        d = digit - 1
+        for p in PEERS[idx]:
+            if not state.cells[p] and not state.masks[p] & bit:
+                if not any(self.placed[u][d] for u in CELL_UNITS[p]):
+                    state.restore(p, bit)
+
+    def grid(self):
+        return self.state.grid()
+
+    def candidates(self, i, j):
+        m = self.state.masks[i*9 + j]
+        return [d + 1 for d in range(9) if m >> d & 1]
+
+    def mistakes(self):
+        # Entries that differ from the solution (needs one)
+        if self.solution is None:
+            return []
+        cells = self.state.cells
+        return [(idx // 9, idx % 9) for idx in range(81)
+                if cells[idx] and not self.givens[idx] and cells[idx] != self.solution[idx]]
+
+    def hint(self):
+        # The next logical step for the current board, as a dict with
+        # "technique" (None when nothing applies), "text" and either "cell"
+        # and "digit" or "eliminations" (cell -> removed digits)
+        if "hint" not in self._cached:
+            self._cached["hint"] = self._hint()
+        return self._cached["hint"]
+
+    def _hint(self):
+        state = self.state
+        mistakes = self.mistakes()
+        if mistakes:
+            i, j = mistakes[0]
+            return {"technique": "mistake", "cell": (i, j), "text": f"{_cell_name(i*9 + j)} is wrong"}
+        masks, cells = state.masks, state.cells
+        for idx in range(81):
+            if not cells[idx] and not masks[idx]:
+                return {"technique": "contradiction", "cell": (idx // 9, idx % 9),
+                        "text": f"{_cell_name(idx)} has no candidates left"}
+        for idx in range(81):
+            if POPCOUNT[masks[idx]] == 1:
+                digit = masks[idx].bit_length()
+                return {"technique": "naked_single", "cell": (idx // 9, idx % 9), "digit": digit,
+                        "text": f"{_cell_name(idx)} can only be {digit}"}
+        for u in range(27):
+            for d in range(9):
+                if state.counts[u][d] == 1:
+                    idx = next(idx for idx in UNITS[u] if masks[idx] >> d & 1)
+                    return {"technique": "hidden_single", "cell": (idx // 9, idx % 9), "digit": d + 1,
+                            "text": f"{d + 1} fits only {_cell_name(idx)} in its {UNIT_NAMES[u // 9]}"}
+        trial = state.copy()
+        for name, technique in TECHNIQUES:
+            if technique(trial):
+                eliminations = {}
+                for idx in range(81):
+                    removed = masks[idx] & ~trial.masks[idx]
+                    if removed:
+                        eliminations[(idx // 9, idx % 9)] = [d + 1 for d in range(9) if removed >> d & 1]
+                text = name.replace("_", " ") + ": " + ", ".join(
+                    f"{_cell_name(i*9 + j)} not {'/'.join(map(str, ds))}" for (i, j), ds in eliminations.items())
+                return {"technique": name, "eliminations": eliminations, "text": text}
+        return {"technique": None, "text": "no logical step found"}
+
+    def analysis(self):
+        # solver.analyze of the remaining puzzle; while the board has wrong
+        # entries it is analyzed without them
+        if "analysis" not in self._cached:
+            mistakes = self.mistakes()
+            if mistakes:
+                grid = self.state.grid()
+                for i, j in mistakes:
+                    grid[i][j] = 0
+                self._cached["analysis"] = analyze(grid)
+            else:
+                self._cached["analysis"] = analyze(Puzzle(bytes(self.state.cells)), state=self.state)
+        return self._cached["analysis"]
+
+    def features(self):
+        return list(self.analysis()["features"])
+
+    def activations(self):
+        # Classifier activations for the remaining puzzle, as passed to
+        # ui.draw_nn_diagram (input layer first)
+        if "activations" not in self._cached:
+            from adjuster import get_nn_activations
+            self._cached["activations"] = get_nn_activations(self.features())
+        return self._cached["activations"]
@@ -1,77 +1,144 @@
 import os
+import threading
+import time
 
-from solver import generate_full_grid, remove_numbers, solve, logical_solve, classify_difficulty_nn, extract_features, classify_difficulty
-from tracking import get_summary, save_performance, get_last_performance, plot_progress, init_db, init_actions_db
+import startup
+startup.install_if_requested()
+import instrument
+instrument.enable_if_requested()
+
+from solver import generate_full_grid, remove_numbers, generate_puzzle, classify_difficulty_nn, classify_difficulty
+from tracking import get_summary, save_performance, get_last_performance, plot_progress, init_db, init_actions_db, start_session, start_game
 from ui import run_ui
-from adjuster import suggest_difficulty, get_nn_activations
-
-def ensure_classifier():
-    if not os.path.exists("difficulty_classifier.pkl"):
-        print("difficulty_classifier.pkl not found. Generating training data and training model...")
-        import csv
-
-        # Step 1: Collect training data
-        NUM_SAMPLES = 200
-        with open("sudoku_difficulty_data.csv", "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["num_clues", "naked_single", "hidden_single", "naked_pair", "pointing_pair", "label"])
-            for _ in range(NUM_SAMPLES):
-                full_grid = generate_full_grid()
-                puzzle = remove_numbers(full_grid, attempts=30)
-                features = extract_features(puzzle)
-                label = classify_difficulty(puzzle)
-                writer.writerow(features + [label])
-
-        # Step 2: Train the classifier
-        import pandas as pd
-        from sklearn.neural_network import MLPClassifier
-        import joblib
-
-        df = pd.read_csv("sudoku_difficulty_data.csv")
-        X = df[["num_clues", "naked_single", "hidden_single", "naked_pair", "pointing_pair"]].values
-        y = df["label"].values
-
-        clf = MLPClassifier(hidden_layer_sizes=(10, 10), max_iter=1000, random_state=42)
-        clf.fit(X, y)
-        joblib.dump(clf, "difficulty_classifier.pkl")
-        print("Model trained and saved as difficulty_classifier.pkl")
+from adjuster import suggest_difficulty, get_nn_activations, update_adjuster, render_surface_async, PLOT_SURFACE
+from puzzle import Puzzle
+from pool import PuzzlePool
+
+CLASSIFIER_PKL = "difficulty_classifier.pkl"
+CLASSIFIER_NPZ = "difficulty_classifier.npz"
+GENERATION_BUDGET_MS = 200  # On-the-spot generation when the pool is empty
+
+def _prepare_classifier():
+    with instrument.span("classifier_bootstrap"):
+        _build_classifier()
+
+def _build_classifier():
+    # A pickle without current npz weights comes from an install that
+    # predates FEATURE_SCHEMA (or a schema change), so it is retrained rather
+    # than exported
+    if not classifier_ready() or not os.path.exists(CLASSIFIER_PKL):
+        if os.path.exists(CLASSIFIER_PKL):
+            print("difficulty_classifier.pkl was trained on older features. Generating training data and retraining...")
+        else:
+            print("difficulty_classifier.pkl not found. Generating training data and training model...")
+        from collect_training_data import collect
+
+        # Step 1: Collect training data (in-process: this may run on a thread)
+        collect("sudoku_difficulty_data.csv", num_samples=200, resume=False, workers=0)
+
+        # Step 2: Train the classifier (versioned, published atomically)
+        from train_difficulty_classifier import train_and_save
+        train_and_save("sudoku_difficulty_data.csv", verbose=False)
+
+def ensure_classifier(background=False):
+    # Make sure the classifier weights exist. With background=True the work
+    # runs on a thread that is returned (None if nothing needed doing); use
+    # classifier_ready() to check whether the model can be used yet.
+    if classifier_ready() and os.path.exists(CLASSIFIER_PKL):
+        return None
+    if not background:
+        _prepare_classifier()
+        return None
+    thread = threading.Thread(target=_prepare_classifier, name="classifier-bootstrap", daemon=True)
+    thread.start()
+    return thread
+
+def classifier_ready():
+    from inference import classifier_current
+    return classifier_current(CLASSIFIER_NPZ)
 
 if __name__ == "__main__":
-    ensure_classifier()
-    init_db()
-    init_actions_db()
-    last = get_last_performance()
+    # Train or export the classifier off the critical path; until it is ready
+    # puzzles are rated with the logic-based classifier
+    bootstrap = ensure_classifier(background=True)
+    startup.mark("classifier check")
+    with instrument.span("database"):
+        init_db()
+        init_actions_db()
+        start_session()
+        last = get_last_performance()
     if last:
         recent_difficulty, recent_time, recent_errors = last
     else:
         recent_difficulty = "Medium"
         recent_time = 50.0
         recent_errors = 1
+    startup.mark("database")
 
-    # AI suggests next difficulty
-    suggested = suggest_difficulty(recent_difficulty, recent_time, recent_errors)
+    # AI suggests next difficulty (model is updated after the game)
+    with instrument.span("suggestion"):
+        suggested = suggest_difficulty(recent_difficulty, recent_time, recent_errors, update=False)
     print("\nAI-Suggested Difficulty:", suggested)
+    startup.mark("difficulty suggestion")
 
-    # Generate and classify puzzle
-    full_grid = generate_full_grid()
-    puzzle = remove_numbers(full_grid, attempts=30)
-    difficulty = classify_difficulty_nn(puzzle)
-    print("\nClassified Difficulty (NN):", difficulty)
+    # Take a pre-rated puzzle of the suggested difficulty from the pool,
+    # generating one on the spot only if that bucket is empty, and any
+    # puzzle if that difficulty cannot be generated (Hard) or not in time
+    with instrument.span("generation", difficulty=suggested) as span:
+        pool = PuzzlePool()
+        puzzle = pool.take(suggested)
+        source = "pool"
+        if puzzle is None:
+            puzzle, _ = generate_puzzle(suggested, budget_ms=GENERATION_BUDGET_MS)
+            source = "generated"
+        if puzzle is None:
+            full_grid = generate_full_grid()
+            puzzle = Puzzle(remove_numbers(full_grid, attempts=30, unique=True), solution=full_grid)
+            source = "fallback"
+        span.set(source=source)
+    pool.start_refill()
+    startup.mark("puzzle generation")
+    with instrument.span("rating") as span:
+        if classifier_ready():
+            difficulty = classify_difficulty_nn(puzzle)
+            print("\nClassified Difficulty (NN):", difficulty)
+            # Prepare input vector for classifier NN (use puzzle features)
+            input_vec = puzzle.features  # Always returns 5 features, computed once above
+            activations = get_nn_activations(input_vec)
+            span.set(classifier="nn", difficulty=difficulty)
+        else:
+            difficulty = classify_difficulty(puzzle)
+            print("\nClassified Difficulty (logic, classifier not ready yet):", difficulty)
+            activations = None
+            span.set(classifier="logic", difficulty=difficulty)
+        start_game(difficulty)
+    startup.mark("classification")
 
     print("Generated Puzzle:")
     for row in puzzle:
-        print(row)
+        print(list(row))
+
+    ui_start = time.perf_counter()
 
-    # Prepare input vector for classifier NN (use puzzle features)
-    input_vec = extract_features(puzzle)  # Always returns 5 features
-    activations = get_nn_activations(input_vec)
-    run_ui(puzzle, difficulty, suggested, nn_activations=activations)
+    def board_shown():
+        instrument.record("ui_setup", (time.perf_counter() - ui_start) * 1000)
+        startup.mark("board shown")
+        startup.report()
+
+    with instrument.span("game", difficulty=difficulty):
+        run_ui(puzzle, difficulty, suggested, nn_activations=activations, on_first_frame=board_shown)
 
     # Print solution
     print("\nSolution:")
-    solve(puzzle)
-    for row in puzzle:
-        print(row)
+    for row in puzzle.solution:
+        print(list(row))
+
+    # Learn from the game just played, so the next startup can skip it
+    with instrument.span("adjuster_update"):
+        adjuster_state = update_adjuster()
+    surface = None
+    if PLOT_SURFACE and adjuster_state["clf"] is not None:
+        surface = render_surface_async(adjuster_state["clf"])
 
     # Print score summary
     print("\nScore Summary:")
@@ -79,4 +146,9 @@ if __name__ == "__main__":
         print(f"Difficulty: {row[0]}, Avg Time: {row[1]:.2f}s, Avg Errors: {row[2]:.2f}")
     print("\nThank you for playing!")
     print("Visit us at: https://www.pocketfun.com/sudoku")
-    plot_progress()
+    plot_progress(last=1000)
+    pool.stop()
+    for thread in (surface, bootstrap):
+        if thread is not None:
+            thread.join()
+    instrument.flush()
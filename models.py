@@ -0,0 +1,64 @@
+import hashlib
+import os
+import threading
+import time
+
+import instrument
+
+CLASSIFIER_PATH = "difficulty_classifier.pkl"
+
+# path -> {"model", "mtime", "size", "digest", "load_time"}
+_cache = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "reloads": 0, "load_time": 0.0}
+
+def _joblib_load(path):
+    import joblib
+    return joblib.load(path)
+
+def _digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def get_model(path=CLASSIFIER_PATH, loader=_joblib_load):
+    # Returns the model stored at path, loading it at most once per file
+    # version. A changed mtime/size triggers a hash check, and the model is
+    # only reloaded when the contents actually differ.
+    st = os.stat(path)
+    with _lock:
+        entry = _cache.get(path)
+        if entry is not None:
+            if (entry["mtime"], entry["size"]) == (st.st_mtime_ns, st.st_size):
+                _stats["hits"] += 1
+                return entry["model"]
+            digest = _digest(path)
+            if digest == entry["digest"]:
+                entry["mtime"], entry["size"] = st.st_mtime_ns, st.st_size
+                _stats["hits"] += 1
+                return entry["model"]
+            _stats["reloads"] += 1
+        else:
+            digest = _digest(path)
+        _stats["misses"] += 1
+        start = time.perf_counter()
+        with instrument.span("model_load", path=path):
+            model = loader(path)
+        load_time = time.perf_counter() - start
+        _stats["load_time"] += load_time
+        _cache[path] = {"model": model, "mtime": st.st_mtime_ns, "size": st.st_size,
+                        "digest": digest, "load_time": load_time}
+        return model
+
+def registry_stats():
+    # Hit/miss counters, total load time and per-model load times
+    with _lock:
+        stats = dict(_stats)
+        stats["models"] = {path: entry["load_time"] for path, entry in _cache.items()}
+    return stats
+
+def clear_registry():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import sys
+import threading
+
+from puzzle import Puzzle
+from solver import generate_puzzle, DIFFICULTIES
+
+POOL_PATH = "data/puzzle_pool.db"
+LOW_WATER = 20    # A bucket below this many puzzles gets refilled...
+HIGH_WATER = 100  # ...up to this many
+REFILL_BUDGET_MS = 500  # Time allowed for generating one puzzle of a label
+REFILL_PASS = 1000  # Puzzles generated per refill pass
+IDLE_SECONDS = 5.0  # Pause after a pass that stored nothing, doubling...
+MAX_IDLE_SECONDS = 600.0  # ...up to this
+
+class PuzzlePool:
+    # On-disk store of pre-generated, pre-rated puzzles and their solutions,
+    # bucketed by the logic-based difficulty label. take() is one indexed
+    # lookup; a background worker keeps each bucket above LOW_WATER.
+    def __init__(self, path=POOL_PATH, low_water=LOW_WATER, high_water=HIGH_WATER):
+        self.path = path
+        self.low_water = low_water
+        self.high_water = high_water
+        self._stop = threading.Event()
+        self._thread = None
+        self.infeasible = set()  # Labels the generator reported it cannot produce
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS pool (
+                id INTEGER PRIMARY KEY,
+                difficulty TEXT NOT NULL,
+                puzzle BLOB NOT NULL,
+                solution BLOB NOT NULL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pool_difficulty ON pool(difficulty, id)")
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def take(self, difficulty):
+        # Remove and return one puzzle of the given difficulty, or None
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT id, puzzle, solution FROM pool WHERE difficulty = ? LIMIT 1",
+                                   (difficulty,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("DELETE FROM pool WHERE id = ?", (row[0],))
+        finally:
+            conn.close()
+        return Puzzle(row[1], solution=row[2])
+
+    def add(self, puzzles):
+        # Store Puzzles (with known solutions) under their logic label
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT INTO pool (difficulty, puzzle, solution) VALUES (?, ?, ?)",
+                             [(p.label, p.cells, p.solution.cells) for p in puzzles])
+        conn.close()
+
+    def counts(self):
+        conn = self._connect()
+        rows = conn.execute("SELECT difficulty, COUNT(*) FROM pool GROUP BY difficulty").fetchall()
+        conn.close()
+        counts = dict.fromkeys(DIFFICULTIES, 0)
+        counts.update(rows)
+        return counts
+
+    def needs_refill(self, counts=None):
+        counts = counts or self.counts()
+        return [d for d in DIFFICULTIES
+                if d not in self.infeasible and counts.get(d, 0) < self.low_water]
+
+    def refill(self, max_puzzles=None):
+        # Generate puzzles until every bucket that was below LOW_WATER reaches
+        # HIGH_WATER, or until stop() / max_puzzles. A label that cannot be
+        # generated within REFILL_BUDGET_MS is left for the next pass; one the
+        # generator cannot produce at all is skipped from then on.
+        # Returns the number stored.
+        counts = self.counts()
+        wanted = self.needs_refill(counts)
+        added = 0
+        batch = []
+        while wanted and not self._stop.is_set():
+            if max_puzzles is not None and added >= max_puzzles:
+                break
+            for label in list(wanted):
+                puzzle, stats = generate_puzzle(label, budget_ms=REFILL_BUDGET_MS)
+                if puzzle is None:
+                    if stats["infeasible"]:
+                        self.infeasible.add(label)
+                    wanted.remove(label)
+                    continue
+                batch.append(puzzle)
+                added += 1
+                counts[label] += 1
+                if counts[label] >= self.high_water:
+                    wanted.remove(label)
+            if len(batch) >= 16 or (batch and not wanted):
+                self.add(batch)
+                batch = []
+        if batch:
+            self.add(batch)
+        return added
+
+    def _run(self):
+        # Back off while passes add nothing: either every bucket is full or
+        # the missing labels cannot be generated in time
+        idle = IDLE_SECONDS
+        while not self._stop.is_set():
+            try:
+                added = self.refill(max_puzzles=REFILL_PASS)
+            except sqlite3.Error as exc:
+                print(f"Puzzle pool refill failed: {exc}", file=sys.stderr)
+                added = 0
+            if added:
+                idle = IDLE_SECONDS
+            else:
+                self._stop.wait(idle)
+                idle = min(idle * 2, MAX_IDLE_SECONDS)
+
+    def start_refill(self):
+        # Keep the buckets topped up from a background thread
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="puzzle-pool-refill", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,103 @@
+class Puzzle:
+    # Immutable puzzle stored as an 81-byte buffer (row-major, 0 = blank).
+    # Carries its solution when known and memoizes the logic-solver analysis,
+    # so each stage of the pipeline reuses the work of the previous one.
+    # puzzle[i][j] works as for the nested lists used elsewhere.
+    __slots__ = ("cells", "_solution", "_analysis", "_nn_label")
+
+    def __init__(self, grid, solution=None):
+        self.cells = _to_bytes(grid)
+        self._solution = _to_bytes(solution) if solution is not None else None
+        self._analysis = None
+        self._nn_label = None
+
+    @classmethod
+    def of(cls, grid):
+        return grid if isinstance(grid, cls) else cls(grid)
+
+    def __getitem__(self, row):
+        return memoryview(self.cells)[row*9:(row+1)*9]
+
+    def __len__(self):
+        return 9
+
+    def __iter__(self):
+        view = memoryview(self.cells)
+        return (view[i*9:(i+1)*9] for i in range(9))
+
+    def __eq__(self, other):
+        return isinstance(other, Puzzle) and self.cells == other.cells
+
+    def __hash__(self):
+        return hash(self.cells)
+
+    def __repr__(self):
+        return f"Puzzle({self.cells.hex()})"
+
+    def to_grid(self):
+        # Mutable nested-list copy
+        cells = self.cells
+        return [list(cells[i*9:(i+1)*9]) for i in range(9)]
+
+    @property
+    def clues(self):
+        return 81 - self.cells.count(0)
+
+    @property
+    def solution(self):
+        if self._solution is None:
+            from solver import solve
+            grid = self.to_grid()
+            if not solve(grid):
+                raise ValueError("puzzle has no solution")
+            self._solution = _to_bytes(grid)
+        return Puzzle(self._solution, solution=self._solution)
+
+    @property
+    def analysis(self):
+        # solver.analyze, kept on the Puzzle so repeat lookups skip the cache
+        if self._analysis is None:
+            from solver import analyze
+            self._analysis = analyze(self)
+        return self._analysis
+
+    @property
+    def steps(self):
+        # Per-technique step counts from solver.rate
+        return dict(self.analysis["steps"])
+
+    @property
+    def logic_grid(self):
+        # Where singles alone get stuck (solver.logical_solve)
+        return self.analysis["logic_grid"]
+
+    @property
+    def features(self):
+        return list(self.analysis["features"])
+
+    @property
+    def label(self):
+        # Logic-based difficulty (solver.classify_difficulty)
+        return self.analysis["label"]
+
+    @property
+    def nn_label(self):
+        # Classifier difficulty (solver.classify_difficulty_nn)
+        if self._nn_label is None:
+            from inference import classify_batch
+            labels, _ = classify_batch([self.features])
+            self._nn_label = labels[0]
+        return self._nn_label
+
+def _to_bytes(grid):
+    if isinstance(grid, Puzzle):
+        return grid.cells
+    if isinstance(grid, (bytes, bytearray)):
+        cells = bytes(grid)
+    elif hasattr(grid, "ravel"):
+        cells = bytes(grid.ravel().astype("uint8"))
+    else:
+        cells = bytes(v for row in grid for v in row)
+    if len(cells) != 81:
+        raise ValueError(f"expected 81 cells, got {len(cells)}")
+    return cells
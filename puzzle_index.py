@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+
+from puzzle import Puzzle
+from solver import canonical_form, symmetry_hashes
+
+# On-disk log of indexed puzzles: fixed-size records appended by save()
+LOG_DTYPE = np.dtype([("hash", "<u8"), ("cells", "u1", (81,))])
+
+class PuzzleIndex:
+    # Set of puzzles up to symmetry (transposition, row/column/band/stack
+    # permutations, digit relabeling), for dropping duplicates from datasets
+    # and puzzle stores. Puzzles are bucketed by solver.symmetry_hashes; a
+    # bucket holds the first puzzle's cells until a second puzzle lands in
+    # it, and only then are canonical forms computed. Since the hash almost
+    # never collides for different puzzles, checking a batch costs about as
+    # much as hashing it.
+    #
+    # With a log path, the puzzles save() appended there by earlier runs are
+    # part of the index without being loaded: the log is memory-mapped and
+    # only its hashes are kept in memory, sorted, and a logged puzzle is read
+    # back only when a new one has the same hash.
+    def __init__(self, log_path=None):
+        self._buckets = {}  # hash -> cells of the only puzzle, or set of canonical cells
+        self._size = 0
+        self.canonicalized = 0
+        self._pending = []  # (hash, cells) added since the last save()
+        self._log = np.zeros(0, dtype=LOG_DTYPE)
+        self._log_order = np.zeros(0, dtype=np.int64)
+        self._log_hashes = np.zeros(0, dtype=np.uint64)  # Sorted
+        if log_path is not None and os.path.exists(log_path):
+            n = os.path.getsize(log_path) // LOG_DTYPE.itemsize
+            if n:
+                self._log = np.memmap(log_path, dtype=LOG_DTYPE, mode="r", shape=(n,))
+                hashes = np.asarray(self._log["hash"])
+                self._log_order = np.argsort(hashes, kind="stable")
+                self._log_hashes = hashes[self._log_order]
+                self._size = n
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, puzzle):
+        cells = Puzzle.of(puzzle).cells
+        entry = self._entry(int(symmetry_hashes([np.frombuffer(cells, dtype=np.uint8)])[0]))
+        if entry is None:
+            return False
+        if isinstance(entry, bytes) and entry == cells:
+            return True
+        return self._canonical(cells) in self._canonical_set(entry)
+
+    def add(self, puzzle):
+        # True if the puzzle was new
+        return bool(self.add_many([Puzzle.of(puzzle).cells])[0])
+
+    def add_many(self, puzzles):
+        # Add a batch (Puzzles, grids or an (n, 81) array); returns a bool
+        # array marking the puzzles that were new, including only the first
+        # of several equivalent puzzles within the batch
+        if len(puzzles) and isinstance(puzzles[0], (Puzzle, bytes)):
+            puzzles = [np.frombuffer(Puzzle.of(p).cells, dtype=np.uint8) for p in puzzles]
+        grids = np.asarray(puzzles, dtype=np.uint8).reshape(-1, 81)
+        new = np.zeros(len(grids), dtype=bool)
+        for i, h in enumerate(symmetry_hashes(grids).tolist()):
+            cells = grids[i].tobytes()
+            entry = self._entry(h)
+            if entry is None:
+                self._buckets[h] = cells
+            else:
+                if isinstance(entry, bytes):
+                    if entry == cells:
+                        continue
+                    entry = self._buckets[h] = self._canonical_set(entry)
+                canonical = self._canonical(cells)
+                if canonical in entry:
+                    continue
+                entry.add(canonical)
+            self._size += 1
+            self._pending.append((h, cells))
+            new[i] = True
+        return new
+
+    def save(self, log_path):
+        # Append the puzzles added since the last save to the log at log_path
+        if self._pending:
+            records = np.zeros(len(self._pending), dtype=LOG_DTYPE)
+            records["hash"] = [h for h, _ in self._pending]
+            records["cells"] = np.frombuffer(b"".join(cells for _, cells in self._pending),
+                                             dtype=np.uint8).reshape(-1, 81)
+            append_log(log_path, records)
+            self._pending = []
+
+    def _entry(self, h):
+        # Bucket for hash h, loaded from the log the first time it is needed
+        entry = self._buckets.get(h)
+        if entry is None and len(self._log_hashes):
+            key = np.uint64(h)
+            lo = int(np.searchsorted(self._log_hashes, key, "left"))
+            hi = int(np.searchsorted(self._log_hashes, key, "right"))
+            if lo < hi:
+                rows = [self._log["cells"][self._log_order[k]].tobytes() for k in range(lo, hi)]
+                entry = rows[0] if len(rows) == 1 else {self._canonical(cells) for cells in rows}
+                self._buckets[h] = entry
+        return entry
+
+    def _canonical(self, cells):
+        self.canonicalized += 1
+        return canonical_form(cells).cells
+
+    def _canonical_set(self, entry):
+        return {self._canonical(entry)} if isinstance(entry, bytes) else entry
+
+    def stats(self):
+        return {"puzzles": self._size, "buckets": len(self._buckets), "logged": len(self._log),
+                "canonicalized": self.canonicalized}
+
+def append_log(log_path, records):
+    # Append LOG_DTYPE records, dropping a partial record left by an
+    # interrupted write
+    size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    with open(log_path, "ab") as f:
+        f.truncate(size - size % LOG_DTYPE.itemsize)
+        f.write(np.asarray(records, dtype=LOG_DTYPE).tobytes())
+
+def log_puzzles(log_path, puzzles):
+    # Append an (n, 81) batch to the log at log_path without checking it
+    # against the index, e.g. to log a dataset written before logs existed
+    grids = np.asarray(puzzles, dtype=np.uint8).reshape(-1, 81)
+    records = np.zeros(len(grids), dtype=LOG_DTYPE)
+    records["hash"] = symmetry_hashes(grids)
+    records["cells"] = grids
+    append_log(log_path, records)
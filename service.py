@@ -0,0 +1,502 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Headless puzzle service: generation, solving, analysis, classification and
+# difficulty suggestion over HTTP/1.1 on localhost (or a Unix socket), JSON in
+# and out, with keep-alive connections.
+#
+#   POST /generate  {"difficulty": "Medium", "budget_ms": 1000, "seed": 1}  (budget_ms <= MAX_BUDGET_MS)
+#   POST /solve     {"puzzle": "<81 digits, 0 or . for blanks>"}
+#   POST /analyze   {"puzzle": ...}
+#   POST /classify  {"puzzle": ...} or {"features": [...]}
+#   POST /suggest   {"difficulty": "Medium", "time": 120.5, "errors": 2, "update": false}
+#   GET  /stats     per-endpoint latency histograms and batching counters
+#   GET  /health
+#
+# Solving, generation and analysis run on a process pool. Classify requests
+# that arrive within MAX_WAIT_MS of each other are answered from one batched
+# feature extraction and one forward pass of the NumPy classifier.
+#
+#   python service.py serve --port 8765
+#   python service.py load --endpoint classify --concurrency 32 --requests 5000
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BATCH = 64  # Classify requests folded into one forward pass...
+MAX_WAIT_MS = 2.0  # ...waiting at most this long for more to arrive
+MAX_BODY = 1 << 16
+MAX_BUDGET_MS = 10000  # Longest generation a request may ask for
+LATENCY_BUCKETS_MS = [0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+LOAD_CORPUS_PATH = "data/load_corpus.json"  # Puzzles the load generator sends
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _parse_puzzle(value):
+    # 81-character string (0 or . for blanks) or a 9x9 list -> Puzzle
+    from puzzle import Puzzle
+    if isinstance(value, str):
+        text = value.strip().replace(".", "0")
+        if len(text) != 81 or not text.isdigit():
+            raise HTTPError(400, "puzzle must be 81 digits, with 0 or . for blanks")
+        return Puzzle(bytes(int(ch) for ch in text))
+    if (isinstance(value, list) and len(value) == 9
+            and all(isinstance(row, list) and len(row) == 9 for row in value)
+            and all(isinstance(v, int) and 0 <= v <= 9 for row in value for v in row)):
+        return Puzzle(value)
+    raise HTTPError(400, "puzzle must be an 81-digit string or a 9x9 list")
+
+def _text(cells):
+    return "".join(map(str, cells))
+
+# Process pool tasks; arguments and results are plain bytes and dicts
+
+def _init_worker():
+    import solver  # noqa: F401  (pay the import once, before the first request)
+
+def _generate_task(difficulty, budget_ms, seed):
+    from solver import generate_puzzle
+    rng = random.Random(seed) if seed is not None else None
+    puzzle, stats = generate_puzzle(difficulty, budget_ms=budget_ms, rng=rng)
+    if puzzle is None:
+        return None
+    return {"puzzle": _text(puzzle.cells), "solution": _text(puzzle.solution.cells),
+            "label": puzzle.label, "clues": puzzle.clues, "stats": stats}
+
+def _solve_task(cells):
+    from solver import count_solutions, solve
+    from puzzle import Puzzle
+    grid = Puzzle(cells).to_grid()
+    if not solve(grid):
+        return None
+    return {"solution": "".join(str(v) for row in grid for v in row),
+            "unique": count_solutions(Puzzle(cells).to_grid(), limit=2) == 1}
+
+def _analyze_task(cells):
+    from solver import analyze
+    analysis = analyze(cells)
+    return dict(analysis, logic_grid=_text(analysis["logic_grid"].cells), features=list(analysis["features"]))
+
+def _features_task(cells_list):
+    # (features, None) per puzzle, or (None, error message) for one that
+    # could not be analyzed, so it fails alone instead of with its batch
+    from solver import analyze
+    results = []
+    for cells in cells_list:
+        try:
+            results.append((list(analyze(cells)["features"]), None))
+        except Exception as exc:
+            results.append((None, f"{type(exc).__name__}: {exc}"))
+    return results
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+
+    def observe(self, ms, error=False):
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.n += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.errors += error
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-quantile
+        if not self.n:
+            return None
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + [self.max_ms], self.counts):
+            seen += count
+            if seen >= q * self.n:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "n": self.n,
+            "errors": self.errors,
+            "mean_ms": self.total_ms / self.n if self.n else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max_ms,
+            "buckets_ms": dict(zip([str(b) for b in LATENCY_BUCKETS_MS] + ["inf"], self.counts)),
+        }
+
+class _ClassifyBatcher:
+    # Collects classify requests and answers them together: puzzles get their
+    # features from one process pool call, then every row goes through one
+    # classify_batch forward pass
+    def __init__(self, service):
+        self.service = service
+        self.pending = []  # (puzzle cells or None, features or None, future)
+        self.timer = None
+        self.batches = 0
+        self.rows = 0
+        self.largest = 0
+
+    def submit(self, cells=None, features=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((cells, features, future))
+        if len(self.pending) >= MAX_BATCH:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(MAX_WAIT_MS / 1000, self._flush)
+        return future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            await self._classify(batch)
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+
+    async def _classify(self, batch):
+        from inference import CLASSIFIER_NPZ, classifier_current, classify_batch, load_npz
+        from models import get_model
+        puzzles = [cells for cells, features, _ in batch if features is None]
+        computed = iter(await self.service.run(_features_task, puzzles) if puzzles else [])
+        rows, futures = [], []
+        for _, features, future in batch:
+            if features is None:
+                features, error = next(computed)
+                if error is not None:
+                    future.set_exception(HTTPError(400, f"puzzle could not be analyzed: {error}"))
+                    continue
+            rows.append(features)
+            futures.append(future)
+        if not rows:
+            return
+        self.batches += 1
+        self.rows += len(rows)
+        self.largest = max(self.largest, len(rows))
+        if not classifier_current(CLASSIFIER_NPZ):
+            raise HTTPError(503, "the difficulty classifier has not been trained on the current features yet")
+        model = get_model(CLASSIFIER_NPZ, loader=load_npz)
+        labels, probabilities = classify_batch(rows, model)
+        classes = [str(c) for c in model["classes"]]
+        for i, future in enumerate(futures):
+            if not future.done():
+                future.set_result({"label": str(labels[i]), "features": list(rows[i]),
+                                   "probabilities": dict(zip(classes, probabilities[i].tolist())),
+                                   "batch_size": len(rows)})
+
+    def stats(self):
+        return {"batches": self.batches, "rows": self.rows, "largest": self.largest,
+                "mean_size": self.rows / self.batches if self.batches else None}
+
+class PuzzleService:
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+        self.histograms = {}
+        self.batcher = _ClassifyBatcher(self)
+        self.adjuster_lock = asyncio.Lock()  # One adjuster bootstrap at a time
+        self.started = time.time()
+        self.routes = {
+            ("POST", "/generate"): self.generate,
+            ("POST", "/solve"): self.solve,
+            ("POST", "/analyze"): self.analyze,
+            ("POST", "/classify"): self.classify,
+            ("POST", "/suggest"): self.suggest,
+            ("GET", "/stats"): self.stats,
+            ("GET", "/health"): self.health,
+        }
+
+    def start(self):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def generate(self, body):
+        from solver import DIFFICULTIES, generation_feasible
+        difficulty = body.get("difficulty", "Medium")
+        if difficulty not in DIFFICULTIES:
+            raise HTTPError(400, f"difficulty must be one of {DIFFICULTIES}")
+        if not generation_feasible(difficulty):
+            raise HTTPError(400, f"{difficulty} puzzles cannot be generated")
+        budget_ms = body.get("budget_ms", 1000)
+        if isinstance(budget_ms, bool) or not isinstance(budget_ms, (int, float)) or not budget_ms > 0:
+            raise HTTPError(400, "budget_ms must be a positive number")
+        seed = body.get("seed")
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+            raise HTTPError(400, "seed must be an integer")
+        result = await self.run(_generate_task, difficulty, min(budget_ms, MAX_BUDGET_MS), seed)
+        if result is None:
+            raise HTTPError(503, f"no {difficulty} puzzle found within the time budget")
+        return result
+
+    async def solve(self, body):
+        result = await self.run(_solve_task, _parse_puzzle(body.get("puzzle")).cells)
+        if result is None:
+            raise HTTPError(400, "puzzle has no solution")
+        return result
+
+    async def analyze(self, body):
+        return await self.run(_analyze_task, _parse_puzzle(body.get("puzzle")).cells)
+
+    async def classify(self, body):
+        if "features" in body:
+            from solver import FEATURE_NAMES
+            features = body["features"]
+            if (not isinstance(features, list) or len(features) != len(FEATURE_NAMES)
+                    or not all(isinstance(v, (int, float)) for v in features)):
+                raise HTTPError(400, f"features must be a list of {len(FEATURE_NAMES)} numbers: {FEATURE_NAMES}")
+            return await self.batcher.submit(features=features)
+        return await self.batcher.submit(cells=_parse_puzzle(body.get("puzzle")).cells)
+
+    async def suggest(self, body):
+        import adjuster
+        try:
+            args = (body["difficulty"], float(body["time"]), int(body["errors"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPError(400, "suggest needs difficulty, time and errors")
+        if args[0] not in adjuster.diff_map:
+            raise HTTPError(400, f"difficulty must be one of {list(adjuster.diff_map)}")
+        update = body.get("update", False)
+        if not isinstance(update, bool):
+            raise HTTPError(400, "update must be true or false")
+        # Suggestions are read from the exported adjuster weights. The model
+        # is trained on the games in scores.db on first use and, with
+        # "update": true, on the games added since its last update; training
+        # runs off the event loop and one request at a time, since each run
+        # saves the model.
+        loop = asyncio.get_running_loop()
+        if os.path.exists(adjuster.DB_PATH) and (update or not os.path.exists(adjuster.ADJUSTER_NPZ)):
+            async with self.adjuster_lock:
+                if update or not os.path.exists(adjuster.ADJUSTER_NPZ):
+                    await loop.run_in_executor(None, adjuster.update_adjuster)
+        suggestion = await loop.run_in_executor(None, lambda: adjuster.suggest_difficulty(*args, update=False))
+        return {"difficulty": suggestion}
+
+    async def stats(self, body):
+        return {"uptime_s": time.time() - self.started, "workers": self.workers,
+                "endpoints": {path: h.summary() for path, h in sorted(self.histograms.items())},
+                "classify_batches": self.batcher.stats()}
+
+    async def health(self, body):
+        return {"status": "ok"}
+
+    async def dispatch(self, method, path, body):
+        start = time.perf_counter()
+        status = 200
+        try:
+            handler = self.routes.get((method, path))
+            if handler is None:
+                if any(p == path for _, p in self.routes):
+                    raise HTTPError(405, f"{method} not allowed for {path}")
+                raise HTTPError(404, f"no endpoint {path}")
+            try:
+                request = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "body must be JSON")
+            if not isinstance(request, dict):
+                raise HTTPError(400, "body must be a JSON object")
+            payload = await handler(request)
+        except HTTPError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        except Exception as exc:
+            status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+        if (method, path) in self.routes:
+            histogram = self.histograms.setdefault(path, _Histogram())
+            histogram.observe((time.perf_counter() - start) * 1000, error=status != 200)
+        return status, payload
+
+    async def handle(self, reader, writer):
+        # One connection; requests are served in order while it stays open
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, path, version = line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                # Without a usable length the body cannot be skipped, so the
+                # connection is closed after the error response
+                if length < 0:
+                    status, payload = 400, {"error": "invalid Content-Length"}
+                    keep_alive = False
+                elif length > MAX_BODY:
+                    status, payload = 413, {"error": "request body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.dispatch(method, path.partition("?")[0], body)
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host=HOST, port=PORT, unix=None, workers=None):
+    service = PuzzleService(workers)
+    service.start()
+    if unix:
+        server = await asyncio.start_unix_server(service.handle, path=unix)
+        where = unix
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        where = f"http://{host}:{server.sockets[0].getsockname()[1]}"
+    print(f"Puzzle service on {where} with {service.workers} workers", file=sys.stderr, flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+# Load generator
+
+async def _open(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+async def request(reader, writer, method, path, payload=None):
+    # One request on an open keep-alive connection -> (status, JSON payload)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def _payloads(endpoint, puzzles, seed):
+    rng = random.Random(seed)
+    while True:
+        puzzle = rng.choice(puzzles)
+        if endpoint == "generate":
+            yield {"difficulty": rng.choice(["Easy", "Medium", "Expert"]), "seed": rng.randrange(1 << 30)}
+        elif endpoint == "suggest":
+            yield {"difficulty": rng.choice(["Easy", "Medium", "Hard", "Expert"]),
+                   "time": rng.uniform(20, 300), "errors": rng.randint(0, 6)}
+        else:
+            yield {"puzzle": puzzle}
+
+async def load(endpoint="classify", concurrency=16, requests=2000, host=HOST, port=PORT, unix=None, seed=0):
+    # Closed-loop load: `concurrency` connections, each sending its next
+    # request as soon as the previous one is answered
+    from benchmark import CORPUS_LABELS, load_corpus
+    corpus = load_corpus(15, seed, LOAD_CORPUS_PATH)
+    puzzles = [p for label in CORPUS_LABELS for p in corpus[label]]
+    payloads = _payloads(endpoint, puzzles, seed)
+    latencies = []
+    statuses = {}
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        reader, writer = await _open(host, port, unix)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, "POST", f"/{endpoint}", next(payloads))
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "endpoint": endpoint,
+        "requests": n,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_s": n / elapsed,
+        "p50_ms": latencies[n // 2],
+        "p95_ms": latencies[min(n - 1, int(n * 0.95))],
+        "p99_ms": latencies[min(n - 1, int(n * 0.99))],
+        "max_ms": latencies[-1],
+        "statuses": statuses,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local puzzle service and its load generator.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in [("serve", "run the service"), ("load", "measure throughput against a running service")]:
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--host", default=HOST)
+        p.add_argument("--port", type=int, default=PORT)
+        p.add_argument("--unix", help="Unix socket path instead of TCP")
+    sub.choices["serve"].add_argument("--workers", type=int, default=None, help="process pool size")
+    p = sub.choices["load"]
+    p.add_argument("--endpoint", default="classify", choices=["generate", "solve", "analyze", "classify", "suggest"])
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.unix, args.workers))
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = asyncio.run(load(args.endpoint, args.concurrency, args.requests,
+                                  args.host, args.port, args.unix, args.seed))
+        print(json.dumps(result, indent=2))
@@ -1,31 +1,172 @@
 import random
-import copy
-import numpy as np
-import joblib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from itertools import permutations, product
+
+import instrument
+from puzzle import Puzzle
 
 GRID_SIZE = 9
 CELL_SIZE = 60
 WINDOW_SIZE = GRID_SIZE * CELL_SIZE
 
-def generate_full_grid():
-    # Simple backtracking Sudoku generator
-    def fill(grid):
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                if grid[i][j] == 0:
-                    nums = list(range(1, 10))
-                    random.shuffle(nums)
-                    for n in nums:
-                        if is_valid(grid, i, j, n):
-                            grid[i][j] = n
-                            if fill(grid):
-                                return True
-                            grid[i][j] = 0
-                    return False
-        return True
-    grid = [[0]*GRID_SIZE for _ in range(GRID_SIZE)]
-    fill(grid)
-    return grid
+# Cell index tables for the bitmask engine: cells are numbered 0..80 row-major,
+# digit d is stored as bit 1 << (d - 1) in the row/column/box masks.
+ROW_OF = [i // 9 for i in range(81)]
+COL_OF = [i % 9 for i in range(81)]
+BOX_OF = [3 * (i // 27) + (i % 9) // 3 for i in range(81)]
+ALL_DIGITS = 0x1FF
+POPCOUNT = [bin(m).count("1") for m in range(512)]
+
+def _load(grid):
+    # Build the bitmask state for a grid, or None if the givens conflict
+    cells = [0] * 81
+    rows, cols, boxes = [0] * 9, [0] * 9, [0] * 9
+    empties = []
+    for i in range(GRID_SIZE):
+        for j in range(GRID_SIZE):
+            idx = i * 9 + j
+            v = grid[i][j]
+            if v == 0:
+                empties.append(idx)
+                continue
+            bit = 1 << (v - 1)
+            b = BOX_OF[idx]
+            if rows[i] & bit or cols[j] & bit or boxes[b] & bit:
+                return None
+            cells[idx] = v
+            rows[i] |= bit
+            cols[j] |= bit
+            boxes[b] |= bit
+    return cells, rows, cols, boxes, empties
+
+def _search(state, stats, limit=1, rng=None):
+    # Depth-first search that always expands the most constrained empty cell.
+    # Cells with a single candidate are placed without branching. Returns the
+    # number of solutions found (at most limit); the state holds the last
+    # solution exactly when the return value reaches limit.
+    cells, rows, cols, boxes, empties = state
+    trail = []
+    while True:
+        best, best_count, best_mask = -1, 10, 0
+        for idx in empties:
+            if cells[idx]:
+                continue
+            m = ALL_DIGITS & ~(rows[ROW_OF[idx]] | cols[COL_OF[idx]] | boxes[BOX_OF[idx]])
+            n = POPCOUNT[m]
+            if n < best_count:
+                best, best_count, best_mask = idx, n, m
+                if n <= 1:
+                    break
+        if best < 0:
+            if limit > 1:
+                _undo(state, trail)
+            return 1
+        if best_count == 0:
+            _undo(state, trail)
+            return 0
+        if best_count > 1:
+            break
+        _place(state, best, best_mask)
+        trail.append(best)
+
+    digits = []
+    m = best_mask
+    while m:
+        bit = m & -m
+        digits.append(bit)
+        m ^= bit
+    if rng is not None:
+        rng.shuffle(digits)
+
+    found = 0
+    for bit in digits:
+        stats["nodes"] += 1
+        _place(state, best, bit)
+        found += _search(state, stats, limit - found, rng)
+        if found >= limit:
+            return found
+        _unplace(state, best)
+        stats["backtracks"] += 1
+    _undo(state, trail)
+    return found
+
+def _place(state, idx, bit):
+    cells, rows, cols, boxes, _ = state
+    cells[idx] = bit.bit_length()
+    rows[ROW_OF[idx]] |= bit
+    cols[COL_OF[idx]] |= bit
+    boxes[BOX_OF[idx]] |= bit
+
+def _unplace(state, idx):
+    cells, rows, cols, boxes, _ = state
+    bit = 1 << (cells[idx] - 1)
+    cells[idx] = 0
+    rows[ROW_OF[idx]] ^= bit
+    cols[COL_OF[idx]] ^= bit
+    boxes[BOX_OF[idx]] ^= bit
+
+def _undo(state, trail):
+    while trail:
+        _unplace(state, trail.pop())
+
+def generate_full_grid(rng=None):
+    # Random full grid: bitmask search over an empty board with shuffled digit order
+    state = _load([[0]*GRID_SIZE for _ in range(GRID_SIZE)])
+    _search(state, {"nodes": 0, "backtracks": 0}, rng=rng or random)
+    cells = state[0]
+    return [cells[i*9:(i+1)*9] for i in range(GRID_SIZE)]
+
+# The batch API below imports numpy on first use, keeping it off the game's
+# startup path
+NUM_SEED_GRIDS = 16
+BATCH_CHUNK = 1 << 16
+_seed_grids = None
+
+def seed_grids():
+    # Fixed set of full grids that the batch generator transforms; built from
+    # a private RNG so every run (and every process) sees the same seeds
+    import numpy as np
+    global _seed_grids
+    if _seed_grids is None:
+        rng = random.Random(0)
+        _seed_grids = np.array([generate_full_grid(rng) for _ in range(NUM_SEED_GRIDS)], dtype=np.uint8)
+    return _seed_grids
+
+def _random_perms(rng, n, k):
+    return rng.random((n, k)).argsort(axis=1)
+
+def _transform_grids(seeds, rng, n):
+    # Apply a random validity-preserving transform to n randomly chosen seeds
+    import numpy as np
+    base = seeds[rng.integers(0, len(seeds), n)]
+    # Row order: permute bands, then rows within each band (same for columns)
+    bands = _random_perms(rng, n, 3)
+    in_band = _random_perms(rng, n * 3, 3).reshape(n, 3, 3)
+    rows = (bands[:, :, None] * 3 + np.take_along_axis(in_band, bands[:, :, None], axis=1)).reshape(n, 9)
+    stacks = _random_perms(rng, n, 3)
+    in_stack = _random_perms(rng, n * 3, 3).reshape(n, 3, 3)
+    cols = (stacks[:, :, None] * 3 + np.take_along_axis(in_stack, stacks[:, :, None], axis=1)).reshape(n, 9)
+    grids = base[np.arange(n)[:, None, None], rows[:, :, None], cols[:, None, :]]
+    flip = rng.random(n) < 0.5
+    grids[flip] = grids[flip].transpose(0, 2, 1)
+    # Digit relabeling; column 0 keeps blanks as 0
+    labels = np.zeros((n, 10), dtype=np.uint8)
+    labels[:, 1:] = _random_perms(rng, n, 9) + 1
+    return np.take_along_axis(labels, grids.reshape(n, 81), axis=1).reshape(n, 9, 9)
+
+def generate_full_grids(n, seed=None):
+    # Batch of n full grids as an (n, 9, 9) uint8 array, reproducible from seed
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    seeds = seed_grids()
+    out = np.empty((n, 9, 9), dtype=np.uint8)
+    for start in range(0, n, BATCH_CHUNK):
+        stop = min(n, start + BATCH_CHUNK)
+        out[start:stop] = _transform_grids(seeds, rng, stop - start)
+    return out
 
 def is_valid(grid, row, col, num):
     for i in range(GRID_SIZE):
@@ -38,97 +179,674 @@ def is_valid(grid, row, col, num):
                 return False
     return True
 
-def remove_numbers(grid, attempts=30):
-    puzzle = copy.deepcopy(grid)
+SYMMETRIES = {
+    "none": lambda r, c: [(r, c)],
+    "rotational": lambda r, c: [(r, c), (8 - r, 8 - c)],
+    "diagonal": lambda r, c: [(r, c), (c, r)],
+    "mirror": lambda r, c: [(r, c), (r, 8 - c)],
+}
+
+def remove_numbers(grid, attempts=30, unique=False, min_clues=17, symmetry="none", rng=None):
+    # Blanks `attempts` random cells. With unique=True a clue (or its symmetry
+    # orbit) is only removed while the puzzle keeps exactly one solution and at
+    # least min_clues clues, so fewer than `attempts` cells may end up blank.
+    rng = rng or random
+    if unique:
+        return _remove_numbers_unique(grid, attempts, min_clues, symmetry, rng)
+    puzzle = [list(row) for row in grid]  # Also copies a Puzzle's read-only rows
     while attempts > 0:
-        row, col = random.randint(0,8), random.randint(0,8)
+        row, col = rng.randint(0,8), rng.randint(0,8)
         while puzzle[row][col] == 0:
-            row, col = random.randint(0,8), random.randint(0,8)
+            row, col = rng.randint(0,8), rng.randint(0,8)
         backup = puzzle[row][col]
         puzzle[row][col] = 0
         attempts -= 1
     return puzzle
 
-def solve(grid):
-    for i in range(GRID_SIZE):
-        for j in range(GRID_SIZE):
-            if grid[i][j] == 0:
-                for n in range(1, 10):
-                    if is_valid(grid, i, j, n):
-                        grid[i][j] = n
-                        if solve(grid):
-                            return True
-                        grid[i][j] = 0
+def _remove_numbers_unique(grid, attempts, min_clues, symmetry, rng):
+    orbit_of = SYMMETRIES[symmetry]
+    puzzle = [list(row) for row in grid]
+    clues = sum(cell != 0 for row in puzzle for cell in row)
+    order = [(r, c) for r in range(9) for c in range(9)]
+    rng.shuffle(order)
+    removed = 0
+    for r, c in order:
+        if removed >= attempts:
+            break
+        orbit = sorted(set(orbit_of(r, c)))
+        if any(puzzle[i][j] == 0 for i, j in orbit):
+            continue
+        if removed + len(orbit) > attempts or clues - len(orbit) < min_clues:
+            continue
+        backup = [puzzle[i][j] for i, j in orbit]
+        for i, j in orbit:
+            puzzle[i][j] = 0
+        if _still_unique(puzzle, orbit, backup):
+            removed += len(orbit)
+            clues -= len(orbit)
+        else:
+            for (i, j), v in zip(orbit, backup):
+                puzzle[i][j] = v
+    return puzzle
+
+def _still_unique(puzzle, orbit, backup):
+    # The puzzle was unique before the orbit was blanked, so a second solution
+    # must differ from the old one in some blanked cell. Look for one cell by
+    # cell (earlier cells pinned to their old value); most removals leave the
+    # cell forced and need no search at all.
+    state = _load(puzzle)
+    cells, rows, cols, boxes, _ = state
+    stats = {"nodes": 0, "backtracks": 0}
+    for (i, j), v in zip(orbit, backup):
+        idx = i*9 + j
+        bit = 1 << (v - 1)
+        m = ALL_DIGITS & ~(rows[i] | cols[j] | boxes[BOX_OF[idx]] | bit)
+        while m:
+            alt = m & -m
+            m ^= alt
+            _place(state, idx, alt)
+            if _search(state, stats):
                 return False
+            _unplace(state, idx)
+        _place(state, idx, bit)
     return True
 
+def remove_numbers_batch(grids, attempts=30, seed=None):
+    # Vectorized remove_numbers: blanks `attempts` distinct random cells per grid
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    n = len(grids)
+    puzzles = np.array(grids, dtype=np.uint8).reshape(n, 81)
+    for start in range(0, n, BATCH_CHUNK):
+        stop = min(n, start + BATCH_CHUNK)
+        order = np.argsort(rng.random((stop - start, 81)), axis=1)[:, :attempts]
+        np.put_along_axis(puzzles[start:stop], order, 0, axis=1)
+    return puzzles.reshape(n, 9, 9)
+
+# Canonical form under the Sudoku symmetry group: transposition, band and
+# stack permutations, row and column permutations within them, and digit
+# relabeling. canonical_form is the lexicographically smallest equivalent
+# puzzle, reading row by row with digits relabeled in order of appearance
+# and blanks ranked after every digit. It searches row by row, keeping only
+# the row and column orders that tie for the smallest prefix, which costs
+# about a millisecond per puzzle. symmetry_hashes is a cheap invariant of
+# the same group for screening large batches: equivalent puzzles always get
+# the same hash, and different ones almost never do.
+BLANK_RANK = 10
+TRANSPOSE = [c*9 + r for r in range(9) for c in range(9)]
+
+def _first_row_key(g, r):
+    # Clues per stack segment, largest first: the best first row a line can
+    # give, since relabeling makes its digits 1, 2, 3... whatever they are
+    return tuple(sorted((3 - g[r*9 + s:r*9 + s + 3].count(0) for s in (0, 3, 6)), reverse=True))
+
+def _first_row_orders(g, r, key):
+    # Column orders that put row r's clues first in every stack and the
+    # stacks in key order. Empty columns of one stack are interchangeable,
+    # so only their ascending order is tried.
+    segs = [g[r*9 + s:r*9 + s + 3] for s in (0, 3, 6)]
+    empty = [not any(g[c::9]) for c in range(9)]
+    parts_by_stack = []
+    for s, seg in enumerate(segs):
+        clues = [3*s + j for j in range(3) if seg[j]]
+        blanks = [3*s + j for j in range(3) if not seg[j]]
+        blank_orders = [b for b in permutations(blanks)
+                        if [c for c in b if empty[c]] == sorted(c for c in b if empty[c])]
+        parts_by_stack.append([a + b for a in permutations(clues) for b in blank_orders])
+    orders = []
+    for stacks in permutations(range(3)):
+        if tuple(3 - segs[s].count(0) for s in stacks) == key:
+            for a, b, c in product(*(parts_by_stack[s] for s in stacks)):
+                orders.append(a + b + c)
+    return orders
+
+def _skip_empty_rows(g, rows):
+    # Empty rows of one band are interchangeable: keep the first of each band
+    seen = set()
+    kept = []
+    for r in rows:
+        if not any(g[r*9:r*9 + 9]):
+            if r // 3 in seen:
+                continue
+            seen.add(r // 3)
+        kept.append(r)
+    return kept
+
+def canonical_form(puzzle):
+    cells = Puzzle.of(puzzle).cells
+    states = []  # (oriented cells, rows so far, column order, digit labels, labels used)
+    best_key = None
+    for g in (cells, bytes(cells[i] for i in TRANSPOSE)):
+        for r in _skip_empty_rows(g, range(9)):
+            key = _first_row_key(g, r)
+            if best_key is not None and key < best_key:
+                continue
+            if key != best_key:
+                best_key, states = key, []
+            for cols in _first_row_orders(g, r, key):
+                labels = [0] * 10
+                n = 0
+                for c in cols:
+                    v = g[r*9 + c]
+                    if v:
+                        n += 1
+                        labels[v] = n
+                states.append((g, (r,), cols, labels, n))
+    for i in range(1, 9):
+        best = None
+        survivors = []
+        for g, rows, cols, labels, n in states:
+            if i % 3:
+                band = rows[-1] // 3
+                candidates = [r for r in range(band*3, band*3 + 3) if r not in rows]
+            else:
+                used = {r // 3 for r in rows}
+                candidates = [r for r in range(9) if r // 3 not in used]
+            for r in _skip_empty_rows(g, candidates):
+                base = r * 9
+                labels_r = labels[:]
+                m = n
+                line = []
+                for c in cols:
+                    v = g[base + c]
+                    if not v:
+                        x = BLANK_RANK
+                    else:
+                        x = labels_r[v]
+                        if not x:
+                            m += 1
+                            x = labels_r[v] = m
+                    line.append(x)
+                    # Stop at the first position that loses to the best line
+                    if best is not None and x != best[len(line) - 1]:
+                        break
+                if best is not None and line[-1] > best[len(line) - 1]:
+                    continue
+                for c in cols[len(line):]:
+                    v = g[base + c]
+                    if not v:
+                        line.append(BLANK_RANK)
+                    else:
+                        if not labels_r[v]:
+                            m += 1
+                            labels_r[v] = m
+                        line.append(labels_r[v])
+                if best is None or line < best:
+                    best, survivors = line, []
+                survivors.append((g, rows + (r,), cols, labels_r, m))
+        states = survivors
+    g, rows, cols, labels, _ = states[0]
+    return Puzzle(bytes(labels[g[r*9 + c]] for r in rows for c in cols))
+
+def _fnv(h, values):
+    import numpy as np
+    for k in range(values.shape[1]):
+        h = (h ^ values[:, k]) * np.uint64(0x100000001B3)
+    return h
+
+def _band_codes(grids):
+    # Per band: sorted clues-per-segment of each row, then sorted clues per
+    # box, packed into one integer; sorted across bands
+    import numpy as np
+    n = len(grids)
+    seg = (grids > 0).reshape(n, 3, 3, 3, 3).sum(axis=4, dtype=np.uint64)  # band, row, stack
+    s = np.sort(seg, axis=3)
+    rows = np.sort(s[..., 0] << np.uint64(8) | s[..., 1] << np.uint64(4) | s[..., 2], axis=2)
+    boxes = np.sort(seg.sum(axis=2), axis=2)
+    code = np.zeros((n, 3), dtype=np.uint64)
+    for k in range(3):
+        code = code << np.uint64(12) | rows[:, :, k]
+    for k in range(3):
+        code = code << np.uint64(4) | boxes[:, :, k]
+    return np.sort(code, axis=1)
+
+def _digit_codes(grids):
+    # Per digit: its sorted counts over the three bands
+    import numpy as np
+    n = len(grids)
+    bins = np.arange(n * 3, dtype=np.int64).reshape(n, 3, 1) * 10 + grids.reshape(n, 3, 27)
+    counts = np.bincount(bins.ravel(), minlength=n * 30).reshape(n, 3, 10)[:, :, 1:].astype(np.uint64)
+    counts = np.sort(counts, axis=1)
+    return counts[:, 0] << np.uint64(8) | counts[:, 1] << np.uint64(4) | counts[:, 2]
+
+def symmetry_hashes(puzzles):
+    # uint64 invariant per puzzle of an (n, 81) or (n, 9, 9) batch
+    import numpy as np
+    grids = np.asarray(puzzles, dtype=np.uint8).reshape(-1, 9, 9)
+    out = np.empty(len(grids), dtype=np.uint64)
+    for start in range(0, len(grids), BATCH_CHUNK):
+        g = grids[start:start + BATCH_CHUNK]
+        t = g.transpose(0, 2, 1)
+        bands, stacks = _band_codes(g), _band_codes(t)
+        by_band, by_stack = _digit_codes(g), _digit_codes(t)
+        h = np.full(len(g), 0xCBF29CE484222325, dtype=np.uint64)
+        # Hash both orientations and keep the smaller, so transposing the
+        # puzzle does not change the result
+        a = _fnv(_fnv(_fnv(h, bands), stacks), np.sort(by_band << np.uint64(12) | by_stack, axis=1))
+        b = _fnv(_fnv(_fnv(h, stacks), bands), np.sort(by_stack << np.uint64(12) | by_band, axis=1))
+        out[start:start + len(g)] = np.minimum(a, b)
+    return out
+
+def solve(grid, stats=None):
+    # Solves grid in place; stats (if given) receives node and backtrack counts
+    if isinstance(grid, Puzzle):
+        raise TypeError("Puzzle is immutable; use puzzle.solution")
+    if stats is None:
+        stats = {}
+    stats["nodes"] = 0
+    stats["backtracks"] = 0
+    state = _load(grid)
+    solved = state is not None and _search(state, stats)
+    if instrument.ACTIVE:
+        instrument.count("solve.calls")
+        instrument.count_many(stats, "solve.")
+    if not solved:
+        return False
+    cells = state[0]
+    for idx in state[4]:
+        grid[idx // 9][idx % 9] = cells[idx]
+    return True
+
+# Units are numbered rows 0..8, columns 9..17, boxes 18..26
+UNITS = ([[r*9 + c for c in range(9)] for r in range(9)] +
+         [[r*9 + c for r in range(9)] for c in range(9)] +
+         [[(3*(b//3) + i)*9 + 3*(b%3) + j for i in range(3) for j in range(3)] for b in range(9)])
+CELL_UNITS = [(ROW_OF[i], 9 + COL_OF[i], 18 + BOX_OF[i]) for i in range(81)]
+PEERS = [sorted({p for u in CELL_UNITS[i] for p in UNITS[u]} - {i}) for i in range(81)]
+
+def _hidden_key(unit, d):
+    # Position of (unit, digit) in logical_solve's hidden-single sweep, which
+    # visits row u, column u, box u for u = 0..8 and digits 1..9 within each
+    kind, u = divmod(unit, 9)
+    return u*27 + kind*9 + d
+
+HIDDEN_KEYS = [[_hidden_key(u, d) for d in range(9)] for u in range(27)]
+
+class CandidateState:
+    # Candidate bitmasks for every cell, updated incrementally as digits are
+    # placed, plus per-unit digit counts and queues of pending singles
+    def __init__(self, puzzle):
+        self.cells = [puzzle[i][j] for i in range(9) for j in range(9)]
+        self.masks = [0] * 81
+        self.counts = [[0] * 9 for _ in range(27)]
+        self.naked = set()
+        self.hidden = set()
+        self.eliminations = 0  # Candidates removed by place() and eliminate()
+        used = [0] * 27
+        for idx, v in enumerate(self.cells):
+            if v:
+                for u in CELL_UNITS[idx]:
+                    used[u] |= 1 << (v - 1)
+        for idx, v in enumerate(self.cells):
+            if v:
+                continue
+            r, c, b = CELL_UNITS[idx]
+            m = ALL_DIGITS & ~(used[r] | used[c] | used[b])
+            self.masks[idx] = m
+            if POPCOUNT[m] == 1:
+                self.naked.add(idx)
+            while m:
+                bit = m & -m
+                d = bit.bit_length() - 1
+                for u in (r, c, b):
+                    self.counts[u][d] += 1
+                m ^= bit
+        for u in range(27):
+            for d in range(9):
+                if self.counts[u][d] == 1:
+                    self.hidden.add(HIDDEN_KEYS[u][d])
+
+    def place(self, idx, digit):
+        # Place digit at idx and eliminate it from the peers; returns the cells
+        # and hidden-single keys that became pending as a result
+        bit = 1 << (digit - 1)
+        masks, counts = self.masks, self.counts
+        new_naked, new_hidden = [], []
+        m = masks[idx]
+        units = CELL_UNITS[idx]
+        while m:
+            b = m & -m
+            d = b.bit_length() - 1
+            for u in units:
+                counts[u][d] -= 1
+                if counts[u][d] == 1:
+                    new_hidden.append(HIDDEN_KEYS[u][d])
+            m ^= b
+        self.cells[idx] = digit
+        masks[idx] = 0
+        d = digit - 1
+        eliminated = 0
+        for p in PEERS[idx]:
+            pm = masks[p]
+            if pm & bit:
+                pm ^= bit
+                masks[p] = pm
+                eliminated += 1
+                if POPCOUNT[pm] == 1:
+                    new_naked.append(p)
+                for u in CELL_UNITS[p]:
+                    counts[u][d] -= 1
+                    if counts[u][d] == 1:
+                        new_hidden.append(HIDDEN_KEYS[u][d])
+        self.eliminations += eliminated
+        self.naked.update(new_naked)
+        self.hidden.update(new_hidden)
+        return new_naked, new_hidden
+
+    def eliminate(self, idx, bits):
+        # Remove candidate bits from empty cell idx, queueing any singles this
+        # creates; returns whether any of the bits were still candidates
+        m = self.masks[idx]
+        bits &= m
+        if not bits:
+            return False
+        m ^= bits
+        self.masks[idx] = m
+        self.eliminations += POPCOUNT[bits]
+        if POPCOUNT[m] == 1:
+            self.naked.add(idx)
+        counts = self.counts
+        while bits:
+            b = bits & -bits
+            d = b.bit_length() - 1
+            for u in CELL_UNITS[idx]:
+                counts[u][d] -= 1
+                if counts[u][d] == 1:
+                    self.hidden.add(HIDDEN_KEYS[u][d])
+            bits ^= b
+        return True
+
+    def restore(self, idx, bits):
+        # Inverse of eliminate: give empty cell idx the candidate bits back,
+        # e.g. after a peer's digit is deleted; returns the bits added
+        m = self.masks[idx]
+        bits &= ~m
+        if not bits or self.cells[idx]:
+            return 0
+        m |= bits
+        self.masks[idx] = m
+        if POPCOUNT[m] == 1:
+            self.naked.add(idx)
+        counts = self.counts
+        added = bits
+        while bits:
+            b = bits & -bits
+            d = b.bit_length() - 1
+            for u in CELL_UNITS[idx]:
+                counts[u][d] += 1
+                if counts[u][d] == 1:
+                    self.hidden.add(HIDDEN_KEYS[u][d])
+            bits ^= b
+        return added
+
+    def copy(self):
+        state = CandidateState.__new__(CandidateState)
+        state.cells = self.cells[:]
+        state.masks = self.masks[:]
+        state.counts = [row[:] for row in self.counts]
+        state.naked = set(self.naked)
+        state.hidden = set(self.hidden)
+        state.eliminations = 0
+        return state
+
+    def hidden_cell(self, key):
+        # Cell holding the only candidate for the (unit, digit) behind key, or -1
+        u, rest = divmod(key, 27)
+        kind, d = divmod(rest, 9)
+        unit = kind*9 + u
+        if self.counts[unit][d] != 1:
+            return -1
+        bit = 1 << d
+        for idx in UNITS[unit]:
+            if self.masks[idx] & bit:
+                return idx
+        return -1
+
+    def grid(self):
+        cells = self.cells
+        return [cells[i*9:(i+1)*9] for i in range(9)]
+
+def _naked_pass(state, steps):
+    # One row-major naked-single sweep: singles behind the sweep position wait
+    # for the next pass, singles ahead of it are taken in this one
+    masks = state.masks
+    heap = [idx for idx in state.naked if masks[idx] and POPCOUNT[masks[idx]] == 1]
+    state.naked = set()
+    heapq.heapify(heap)
+    placed = 0
+    while heap:
+        idx = heapq.heappop(heap)
+        m = masks[idx]
+        if not m or POPCOUNT[m] != 1:
+            continue
+        new_naked, _ = state.place(idx, m.bit_length())
+        steps['naked_single'] += 1
+        placed += 1
+        for p in new_naked:
+            if p > idx:
+                heapq.heappush(heap, p)
+                state.naked.discard(p)
+    return placed
+
+def _hidden_pass(state, steps):
+    # One hidden-single sweep in logical_solve's unit order, same rule as above
+    heap = list(state.hidden)
+    state.hidden = set()
+    heapq.heapify(heap)
+    placed = 0
+    while heap:
+        key = heapq.heappop(heap)
+        idx = state.hidden_cell(key)
+        if idx < 0:
+            continue
+        _, new_hidden = state.place(idx, key % 9 + 1)
+        steps['hidden_single'] += 1
+        placed += 1
+        for k in new_hidden:
+            if k > key:
+                heapq.heappush(heap, k)
+                state.hidden.discard(k)
+    return placed
+
+def count_solutions(grid, limit=2, stats=None):
+    # Number of solutions of grid, counting stops early once limit is reached
+    if stats is None:
+        stats = {}
+    stats["nodes"] = 0
+    stats["backtracks"] = 0
+    state = _load(grid)
+    if state is None:
+        return 0
+    found = _search(state, stats, limit)
+    if instrument.ACTIVE:
+        instrument.count("count_solutions.calls")
+        instrument.count_many(stats, "count_solutions.")
+    return found
+
 def logical_solve(puzzle):
     # Applies naked singles and hidden singles until stuck
-    logic_grid = copy.deepcopy(puzzle)
+    state = CandidateState(puzzle)
     steps = {'naked_single': 0, 'hidden_single': 0, 'naked_pair': 0, 'pointing_pair': 0}
-    progress = True
-
-    def get_candidates(grid, row, col):
-        if grid[row][col] != 0:
-            return set()
-        candidates = set(range(1, 10))
-        # Remove used numbers in row and column
-        candidates -= set(grid[row])
-        candidates -= {grid[i][col] for i in range(9)}
-        # Remove used numbers in box
-        start_row, start_col = 3 * (row // 3), 3 * (col // 3)
-        for i in range(3):
-            for j in range(3):
-                candidates.discard(grid[start_row + i][start_col + j])
-        return candidates
-
-    while progress:
-        progress = False
-        # Naked singles
-        for i in range(9):
-            for j in range(9):
-                if logic_grid[i][j] == 0:
-                    candidates = get_candidates(logic_grid, i, j)
-                    if len(candidates) == 1:
-                        logic_grid[i][j] = candidates.pop()
-                        steps['naked_single'] += 1
-                        progress = True
-        # Hidden singles
-        for unit in range(9):
-            # Rows
-            for num in range(1, 10):
-                positions = [col for col in range(9) if logic_grid[unit][col] == 0 and num in get_candidates(logic_grid, unit, col)]
-                if len(positions) == 1:
-                    logic_grid[unit][positions[0]] = num
-                    steps['hidden_single'] += 1
-                    progress = True
-            # Columns
-            for num in range(1, 10):
-                positions = [row for row in range(9) if logic_grid[row][unit] == 0 and num in get_candidates(logic_grid, row, unit)]
-                if len(positions) == 1:
-                    logic_grid[positions[0]][unit] = num
-                    steps['hidden_single'] += 1
-                    progress = True
-            # Boxes
-            start_row, start_col = 3 * (unit // 3), 3 * (unit % 3)
-            for num in range(1, 10):
-                positions = []
-                for i in range(3):
-                    for j in range(3):
-                        r, c = start_row + i, start_col + j
-                        if logic_grid[r][c] == 0 and num in get_candidates(logic_grid, r, c):
-                            positions.append((r, c))
-                if len(positions) == 1:
-                    r, c = positions[0]
-                    logic_grid[r][c] = num
-                    steps['hidden_single'] += 1
-                    progress = True
-
-    return steps, logic_grid
+    while _naked_pass(state, steps) + _hidden_pass(state, steps):
+        pass
+    return steps, state.grid()
 
-def classify_difficulty(puzzle):
-    # Classify based on logical steps needed to solve
-    steps, logic_grid = logical_solve(puzzle)
+# Techniques beyond singles, cheapest first. Each function looks for one
+# instance that eliminates at least one candidate, applies it and returns
+# True; rate() then goes back to singles before trying anything harder.
+
+def _naked_pair(state):
+    # Two cells of a unit with the same two candidates own those digits
+    masks = state.masks
+    for unit in UNITS:
+        seen = {}
+        for idx in unit:
+            m = masks[idx]
+            if POPCOUNT[m] != 2:
+                continue
+            if m in seen:
+                pair = (seen[m], idx)
+                hit = False
+                for other in unit:
+                    if other not in pair and masks[other] & m:
+                        hit |= state.eliminate(other, m)
+                if hit:
+                    return True
+            else:
+                seen[m] = idx
+    return False
+
+def _box_line(state, units, cross):
+    # Digits whose candidates in one of units all lie in a single unit of
+    # kind `cross` are removed from the rest of that unit
+    masks, counts = state.masks, state.counts
+    for u in units:
+        for d in range(9):
+            if not 2 <= counts[u][d] <= 3:
+                continue
+            bit = 1 << d
+            cells = [idx for idx in UNITS[u] if masks[idx] & bit]
+            for k in cross:
+                target = CELL_UNITS[cells[0]][k]
+                if any(CELL_UNITS[idx][k] != target for idx in cells):
+                    continue
+                hit = False
+                for other in UNITS[target]:
+                    if masks[other] & bit and CELL_UNITS[other][u // 9] != u:
+                        hit |= state.eliminate(other, bit)
+                if hit:
+                    return True
+    return False
+
+def _pointing(state):
+    # Box candidates confined to one row or column
+    return _box_line(state, range(18, 27), (0, 1))
+
+def _claiming(state):
+    # Row or column candidates confined to one box
+    return _box_line(state, range(18), (2,))
+
+def _hidden_pair(state):
+    # Two digits with the same two possible cells in a unit fill those cells
+    masks, counts = state.masks, state.counts
+    for u, unit in enumerate(UNITS):
+        seen = {}
+        for d in range(9):
+            if counts[u][d] != 2:
+                continue
+            bit = 1 << d
+            cells = tuple(idx for idx in unit if masks[idx] & bit)
+            if cells in seen:
+                keep = bit | seen[cells]
+                hit = False
+                for idx in cells:
+                    hit |= state.eliminate(idx, masks[idx] & ~keep)
+                if hit:
+                    return True
+            else:
+                seen[cells] = bit
+    return False
+
+def _x_wing(state):
+    # A digit confined to the same two columns in two rows (or the same two
+    # rows in two columns) is removed from the rest of those columns (rows)
+    masks, counts = state.masks, state.counts
+    for base, cover in ((0, 1), (9, 0)):
+        for d in range(9):
+            bit = 1 << d
+            seen = {}
+            for u in range(base, base + 9):
+                if counts[u][d] != 2:
+                    continue
+                cols = tuple(CELL_UNITS[idx][cover] for idx in UNITS[u] if masks[idx] & bit)
+                if cols in seen:
+                    hit = False
+                    for c in cols:
+                        for other in UNITS[c]:
+                            if masks[other] & bit and CELL_UNITS[other][base // 9] not in (u, seen[cols]):
+                                hit |= state.eliminate(other, bit)
+                    if hit:
+                        return True
+                else:
+                    seen[cols] = u
+    return False
+
+TECHNIQUES = [
+    ("naked_pair", _naked_pair),
+    ("pointing_pair", _pointing),
+    ("claiming", _claiming),
+    ("hidden_pair", _hidden_pair),
+    ("x_wing", _x_wing),
+]
+STEP_NAMES = ["naked_single", "hidden_single"] + [name for name, _ in TECHNIQUES]
+
+def rate(puzzle, budget_ms=None):
+    # Solve with singles, falling back to the techniques above (cheapest
+    # first) whenever singles stall. Returns per-technique step counts and
+    # timings, the grid reached and whether it is solved. "singles" holds the
+    # steps and grid at the first stall, i.e. what logical_solve returns.
+    # Once budget_ms is spent no further techniques are tried.
+    start = time.perf_counter()
+    return _rate_state(CandidateState(puzzle), budget_ms, start)
+
+def _rate_state(state, budget_ms, start):
+    # rate() on a CandidateState, which is consumed
+    deadline = None if budget_ms is None else start + budget_ms / 1000
+    steps = dict.fromkeys(STEP_NAMES, 0)
+    timings = dict.fromkeys(STEP_NAMES, 0.0)
+    singles = None
+    timed_out = False
+    while True:
+        progress = True
+        while progress:
+            t0 = time.perf_counter()
+            progress = _naked_pass(state, steps)
+            t1 = time.perf_counter()
+            progress += _hidden_pass(state, steps)
+            timings["naked_single"] += t1 - t0
+            timings["hidden_single"] += time.perf_counter() - t1
+        if singles is None:
+            singles = {"steps": dict(steps), "grid": state.grid()}
+        if all(state.cells):
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            timed_out = True
+            break
+        for name, technique in TECHNIQUES:
+            t0 = time.perf_counter()
+            hit = technique(state)
+            timings[name] += time.perf_counter() - t0
+            if hit:
+                steps[name] += 1
+                break
+        else:
+            break
+    if instrument.ACTIVE:
+        instrument.count("rate.calls")
+        instrument.count("rate.eliminations", state.eliminations)
+        instrument.count("rate.timed_out", timed_out)
+        instrument.count_many(steps, "rate.")
+    return {
+        "steps": steps,
+        "timings_ms": {name: t * 1000 for name, t in timings.items()},
+        "grid": state.grid(),
+        "solved": all(state.cells),
+        "timed_out": timed_out,
+        "singles": singles,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+DIFFICULTIES = ["Easy", "Medium", "Hard", "Expert"]
+FEATURE_NAMES = ["num_clues", "naked_single", "hidden_single", "naked_pair", "pointing_pair"]
+# What the features mean, recorded in datasets and classifier weights; bump it
+# whenever a feature's meaning changes. Version 1 counted singles only up to
+# the first stall and always gave 0 for the pair features.
+FEATURE_SCHEMA = 2
+
+def difficulty_from_steps(steps, logic_grid):
+    # logic_grid is where singles got stuck, so anything past singles is
+    # Expert; steps may come from logical_solve or rate (identical whenever
+    # singles finish the puzzle)
     total_steps = steps['naked_single'] + steps['hidden_single']
     filled = all(all(cell != 0 for cell in row) for row in logic_grid)
     if not filled:
@@ -140,9 +858,8 @@ def classify_difficulty(puzzle):
     else:
         return "Hard"
 
-def extract_features(puzzle):
+def features_from_steps(puzzle, steps):
     num_clues = sum(cell != 0 for row in puzzle for cell in row)
-    steps, _ = logical_solve(puzzle)
     return [
         num_clues,
         steps['naked_single'],
@@ -151,8 +868,249 @@ def extract_features(puzzle):
         steps['pointing_pair'],
     ]
 
+ANALYSIS_CACHE_SIZE = 4096  # Puzzles whose analysis is kept (least recently used go first)
+
+_analysis_cache = OrderedDict()
+_analysis_lock = threading.Lock()
+_analysis_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def analyze(puzzle, state=None):
+    # Everything derived from the logic solver, from one rate() pass: clues,
+    # per-technique steps, the grid where singles got stuck (logic_grid), the
+    # logic label, whether singles / all techniques complete the puzzle and
+    # the classifier features. Memoized by the puzzle's 81 cell bytes in a
+    # bounded LRU; the returned dict is shared, so do not modify it. A
+    # CandidateState already holding the puzzle (see live.py) saves building
+    # one on a cache miss; it is copied, not changed.
+    puzzle = Puzzle.of(puzzle)
+    key = puzzle.cells
+    with _analysis_lock:
+        analysis = _analysis_cache.get(key)
+        if analysis is not None:
+            _analysis_cache.move_to_end(key)
+            _analysis_stats["hits"] += 1
+    if analysis is not None:
+        if instrument.ACTIVE:
+            instrument.count("analyze.hits")
+        return analysis
+    if state is None:
+        rating = rate(puzzle)
+    else:
+        rating = _rate_state(state.copy(), None, time.perf_counter())
+    steps = rating["steps"]
+    logic_grid = rating["singles"]["grid"]
+    analysis = {
+        "clues": puzzle.clues,
+        "steps": steps,
+        "logic_grid": Puzzle(logic_grid),
+        "label": difficulty_from_steps(steps, logic_grid),
+        "solved_by_singles": all(all(row) for row in logic_grid),
+        "solved": rating["solved"],
+        "features": tuple(features_from_steps(puzzle, steps)),
+    }
+    with _analysis_lock:
+        _analysis_stats["misses"] += 1
+        _analysis_cache[key] = analysis
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+            _analysis_stats["evictions"] += 1
+    if instrument.ACTIVE:
+        instrument.count("analyze.misses")
+    return analysis
+
+def analysis_stats():
+    with _analysis_lock:
+        stats = dict(_analysis_stats, size=len(_analysis_cache))
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+def clear_analysis_cache():
+    with _analysis_lock:
+        _analysis_cache.clear()
+        _analysis_stats.update(hits=0, misses=0, evictions=0)
+
+def classify_difficulty(puzzle):
+    # Classify based on logical steps needed to solve
+    return analyze(puzzle)["label"]
+
+def extract_features(puzzle):
+    return list(analyze(puzzle)["features"])
+
+def rate_puzzle(puzzle):
+    # Features and logic-based label from a single analysis
+    analysis = analyze(puzzle)
+    return list(analysis["features"]), analysis["label"]
+
+# Blank counts generate_puzzle aims for, per target label (see
+# difficulty_from_steps: singles-solvable puzzles are Easy up to 30 blanks
+# and Medium up to 60). Expert removes clues until singles get stuck. Hard
+# needs more than 60 blanks filled by naked singles alone; removal that keeps
+# that property tops out around 59 blanks (60 with local search), so Hard has
+# no entry and generate_puzzle reports it as infeasible instead of spending
+# its budget.
+TARGET_BLANKS = {
+    "Easy": (25, 30),
+    "Medium": (35, 55),
+    "Expert": (81, 81),
+}
+
+def generation_feasible(target_difficulty):
+    return target_difficulty in TARGET_BLANKS
+
+def generate_puzzle(target_difficulty, budget_ms=1000, rng=None):
+    # Unique puzzle whose logic label is target_difficulty, or None if the
+    # budget runs out first or the label cannot be generated (stats then has
+    # infeasible set). Clues are only removed while the puzzle keeps the
+    # properties the label needs, re-rated against the current puzzle after
+    # each removal, so most attempts succeed instead of being rejected
+    # afterwards. Returns (puzzle, stats) with attempts, removals, rerates,
+    # infeasible and elapsed_ms.
+    if target_difficulty not in DIFFICULTIES:
+        raise ValueError(f"unknown difficulty: {target_difficulty}")
+    rng = rng or random
+    start = time.perf_counter()
+    deadline = None if budget_ms is None else start + budget_ms / 1000
+    stats = {"attempts": 0, "removals": 0, "rerates": 0, "elapsed_ms": 0.0,
+             "infeasible": not generation_feasible(target_difficulty)}
+    puzzle = None
+    while puzzle is None and not stats["infeasible"]:
+        if stats["attempts"] and deadline is not None and time.perf_counter() > deadline:
+            break
+        stats["attempts"] += 1
+        solution = generate_full_grid(rng)
+        grid = _guided_removal(solution, target_difficulty, rng, stats)
+        candidate = Puzzle(grid, solution=solution)
+        if candidate.label == target_difficulty:
+            puzzle = candidate
+    stats["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    if instrument.ACTIVE:
+        instrument.count("generate.calls")
+        instrument.count("generate.failed", puzzle is None)
+        instrument.count("generate.infeasible", stats["infeasible"])
+        instrument.count_many({k: stats[k] for k in ("attempts", "removals", "rerates")}, "generate.")
+    return puzzle, stats
+
+def _guided_removal(solution, target, rng, stats):
+    low, high = TARGET_BLANKS[target]
+    goal = rng.randint(low, high)
+    cells = [v for row in solution for v in row]
+    used = [ALL_DIGITS] * 27
+    order = list(range(81))
+    rng.shuffle(order)
+    blanks = 0
+    kept = []
+    # First pass: only clues that come straight back as a single. The puzzle
+    # then stays unique and solvable by singles with no search or re-rating;
+    # a clue that is not forced now never becomes forced later.
+    for idx in order:
+        if blanks >= goal:
+            return _rows(cells)
+        v = cells[idx]
+        _toggle(cells, used, idx, v, 0)
+        if _forced(cells, used, idx, 1 << (v - 1)):
+            blanks += 1
+            stats["removals"] += 1
+        else:
+            _toggle(cells, used, idx, 0, v)
+            kept.append(idx)
+    if target == "Easy":
+        return _rows(cells)
+    # Second pass for Medium and Expert: any removal, re-rated with singles.
+    # The candidate state of the current puzzle is kept up to date, so a
+    # removal only gives the digit back to the cell and its peers, and the
+    # singles run from a copy of that state only until they refill the cell
+    # (_derives). A puzzle that singles still solve is unique, so only a
+    # removal that leaves them stuck needs the uniqueness search. Medium
+    # keeps the removals singles still solve; Expert stops at the first
+    # unique one they do not. Most of Expert's candidates are such stuck,
+    # non-unique removals, which is why it costs about 15-20x Easy.
+    state = CandidateState(_rows(cells))
+    for idx in kept:
+        if blanks >= goal and target == "Medium":
+            break
+        v = cells[idx]
+        _toggle(cells, used, idx, v, 0)
+        _blank_clue(state, used, idx, v)
+        stats["rerates"] += 1
+        trial = state.copy()
+        if _derives(trial, idx):
+            blanks += 1
+            stats["removals"] += 1
+            continue
+        # Singles only fill in forced digits, so searching from where they got
+        # stuck gives the same answer with fewer blanks
+        if target == "Expert" and _still_unique(trial.grid(), [(idx // 9, idx % 9)], [v]):
+            return _rows(cells)
+        _toggle(cells, used, idx, 0, v)
+        state.place(idx, v)
+    return _rows(cells)
+
+def _derives(state, target):
+    # Whether singles, run from state, fill cell target. The puzzle without
+    # target was solved by singles, so once target is placed the rest follows
+    # and the propagation stops there; only a removal that leaves singles
+    # stuck runs them to the end (state then holds where they got stuck).
+    masks, naked, hidden = state.masks, state.naked, state.hidden
+    while naked or hidden:
+        if naked:
+            idx = naked.pop()
+            m = masks[idx]
+            if not m or POPCOUNT[m] != 1:
+                continue
+            digit = m.bit_length()
+        else:
+            key = hidden.pop()
+            idx = state.hidden_cell(key)
+            if idx < 0:
+                continue
+            digit = key % 9 + 1
+        if idx == target:
+            return True
+        state.place(idx, digit)
+    return False
+
+def _blank_clue(state, used, idx, v):
+    # Blank clue v at idx in state, given the unit masks without it: the cell
+    # gets its candidates back and peers that no longer see v get v back
+    state.cells[idx] = 0
+    r, c, b = CELL_UNITS[idx]
+    state.restore(idx, ALL_DIGITS & ~(used[r] | used[c] | used[b]))
+    bit = 1 << (v - 1)
+    for p in PEERS[idx]:
+        if not state.cells[p]:
+            pr, pc, pb = CELL_UNITS[p]
+            if not (used[pr] | used[pc] | used[pb]) & bit:
+                state.restore(p, bit)
+
+def _toggle(cells, used, idx, old, new):
+    cells[idx] = new
+    bit = 1 << ((old or new) - 1)
+    for u in CELL_UNITS[idx]:
+        used[u] ^= bit
+
+def _forced(cells, used, idx, bit):
+    # Whether blank idx is an immediate naked or hidden single, given the
+    # unit masks of the placed digits
+    r, c, b = CELL_UNITS[idx]
+    if ALL_DIGITS & ~(used[r] | used[c] | used[b]) == bit:
+        return True
+    for u in (r, c, b):
+        for q in UNITS[u]:
+            if q != idx and not cells[q]:
+                qr, qc, qb = CELL_UNITS[q]
+                if not (used[qr] | used[qc] | used[qb]) & bit:
+                    break
+        else:
+            return True
+    return False
+
+def _rows(cells):
+    return [cells[i*9:(i+1)*9] for i in range(9)]
+
 def classify_difficulty_nn(puzzle):
-    features = np.array(extract_features(puzzle)).reshape(1, -1)
-    clf = joblib.load("difficulty_classifier.pkl")
-    pred = clf.predict(features)[0]
-    return pred
+    if isinstance(puzzle, Puzzle):
+        return puzzle.nn_label
+    from inference import classify_batch
+    labels, _ = classify_batch([extract_features(puzzle)])
+    return labels[0]
@@ -0,0 +1,68 @@
+import builtins
+import os
+import sys
+import time
+
+# Startup timing report, enabled with `python main.py --startup-report` or
+# SUDOKU_STARTUP_REPORT=1. Like `-X importtime`, but only imports made by this
+# project's modules are listed, each with its inclusive time, next to the
+# phase marks recorded by main.
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_t0 = time.perf_counter()
+_enabled = False
+_marks = []
+_imports = []  # (importer, module, seconds)
+_stack = []
+_original_import = builtins.__import__
+
+def enabled():
+    return _enabled
+
+def _is_project(module_globals):
+    path = (module_globals or {}).get("__file__") or ""
+    return os.path.dirname(os.path.abspath(path)) == PROJECT_DIR if path else False
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules or not _is_project(globals):
+        return _original_import(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _imports.append((globals.get("__name__", "?"), name, time.perf_counter() - start))
+
+def install():
+    # Start recording; call before importing the rest of the project
+    global _enabled, _t0
+    if _enabled:
+        return
+    _enabled = True
+    _t0 = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+def install_if_requested(argv=None):
+    argv = sys.argv if argv is None else argv
+    if "--startup-report" in argv or os.environ.get("SUDOKU_STARTUP_REPORT"):
+        install()
+
+def mark(phase):
+    # Record that a startup phase finished
+    if _enabled:
+        _marks.append((phase, time.perf_counter() - _t0))
+
+def report(file=None):
+    if not _enabled:
+        return
+    file = file or sys.stderr
+    builtins.__import__ = _original_import
+    print("\nStartup report (ms since start, inclusive import times)", file=file)
+    print("  Imports:", file=file)
+    for importer, name, seconds in _imports:
+        print(f"    {seconds * 1000:8.1f}  {importer} -> {name}", file=file)
+    print("  Phases:", file=file)
+    previous = 0.0
+    for phase, at in _marks:
+        print(f"    {at * 1000:8.1f}  (+{(at - previous) * 1000:6.1f})  {phase}", file=file)
+        previous = at
@@ -1,10 +1,22 @@
+import atexit
+import json
 import sqlite3
 import os
-import matplotlib.pyplot as plt
+import sys
+import threading
+import time
 
 DB_PATH = "data/scores.db"
 os.makedirs("data", exist_ok=True)
 
+SCHEMA_VERSION = 2
+
+_session_id = None
+_game_id = None
+
+def _now():
+    return time.time()
+
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
@@ -16,24 +28,208 @@ def init_db():
     )""")
     conn.commit()
     conn.close()
+    migrate()
+
+def migrate(db_path=None):
+    # Upgrade the database to SCHEMA_VERSION (tracked in PRAGMA user_version).
+    # Version 0 is the original layout: bare scores and actions tables.
+    conn = sqlite3.connect(db_path or DB_PATH)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        with conn:
+            conn.execute("BEGIN")
+            _migrate_v1(conn)
+            conn.execute("PRAGMA user_version = 1")
+    if version < 2:
+        with conn:
+            conn.execute("BEGIN")
+            _migrate_v2(conn)
+            conn.execute("PRAGMA user_version = 2")
+    conn.close()
+
+def _migrate_v1(conn):
+    # Sessions, games and timestamps on every row, indexes for the common
+    # lookups, and summary tables kept current by insert triggers. Rows from
+    # before the migration have no session or game.
+    c = conn.cursor()
+    c.execute("""CREATE TABLE IF NOT EXISTS scores (
+        id INTEGER PRIMARY KEY, difficulty TEXT, time REAL, errors INTEGER)""")
+    c.execute("""CREATE TABLE IF NOT EXISTS actions (
+        id INTEGER PRIMARY KEY, row INTEGER, col INTEGER, value INTEGER,
+        time_delta REAL, mistake INTEGER)""")
+    c.execute("""CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY,
+        started_at REAL
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS games (
+        id INTEGER PRIMARY KEY,
+        session_id INTEGER REFERENCES sessions(id),
+        difficulty TEXT,
+        started_at REAL
+    )""")
+    for table in ("scores", "actions"):
+        columns = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+        for column, kind in (("session_id", "INTEGER"), ("game_id", "INTEGER"), ("created_at", "REAL")):
+            if column not in columns:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_session ON games(session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scores_difficulty ON scores(difficulty)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scores_session ON scores(session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scores_game ON scores(game_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_actions_session ON actions(session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_actions_game ON actions(game_id)")
+
+    c.execute("""CREATE TABLE IF NOT EXISTS difficulty_stats (
+        difficulty TEXT PRIMARY KEY,
+        games INTEGER NOT NULL DEFAULT 0,
+        total_time REAL NOT NULL DEFAULT 0,
+        total_errors INTEGER NOT NULL DEFAULT 0
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS session_stats (
+        session_id INTEGER PRIMARY KEY,
+        games INTEGER NOT NULL DEFAULT 0,
+        total_time REAL NOT NULL DEFAULT 0,
+        total_errors INTEGER NOT NULL DEFAULT 0,
+        moves INTEGER NOT NULL DEFAULT 0,
+        mistakes INTEGER NOT NULL DEFAULT 0
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS action_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        moves INTEGER NOT NULL DEFAULT 0,
+        timed_moves INTEGER NOT NULL DEFAULT 0,
+        total_time_delta REAL NOT NULL DEFAULT 0,
+        mistakes INTEGER NOT NULL DEFAULT 0
+    )""")
+
+    c.execute("""CREATE TRIGGER IF NOT EXISTS scores_stats AFTER INSERT ON scores BEGIN
+        INSERT OR IGNORE INTO difficulty_stats (difficulty) VALUES (NEW.difficulty);
+        UPDATE difficulty_stats SET games = games + 1,
+            total_time = total_time + COALESCE(NEW.time, 0),
+            total_errors = total_errors + COALESCE(NEW.errors, 0)
+            WHERE difficulty = NEW.difficulty;
+        INSERT OR IGNORE INTO session_stats (session_id)
+            SELECT NEW.session_id WHERE NEW.session_id IS NOT NULL;
+        UPDATE session_stats SET games = games + 1,
+            total_time = total_time + COALESCE(NEW.time, 0),
+            total_errors = total_errors + COALESCE(NEW.errors, 0)
+            WHERE session_id = NEW.session_id;
+    END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS actions_stats AFTER INSERT ON actions BEGIN
+        UPDATE action_totals SET moves = moves + 1,
+            timed_moves = timed_moves + (NEW.time_delta IS NOT NULL),
+            total_time_delta = total_time_delta + COALESCE(NEW.time_delta, 0),
+            mistakes = mistakes + COALESCE(NEW.mistake, 0)
+            WHERE id = 0;
+        INSERT OR IGNORE INTO session_stats (session_id)
+            SELECT NEW.session_id WHERE NEW.session_id IS NOT NULL;
+        UPDATE session_stats SET moves = moves + 1,
+            mistakes = mistakes + COALESCE(NEW.mistake, 0)
+            WHERE session_id = NEW.session_id;
+    END""")
+
+    # Backfill the summaries from the existing rows
+    c.execute("DELETE FROM difficulty_stats")
+    c.execute("""INSERT INTO difficulty_stats (difficulty, games, total_time, total_errors)
+                 SELECT difficulty, COUNT(*), COALESCE(SUM(time), 0), COALESCE(SUM(errors), 0)
+                 FROM scores WHERE difficulty IS NOT NULL GROUP BY difficulty""")
+    c.execute("DELETE FROM action_totals")
+    c.execute("""INSERT INTO action_totals (id, moves, timed_moves, total_time_delta, mistakes)
+                 SELECT 0, COUNT(*), COUNT(time_delta), COALESCE(SUM(time_delta), 0), COALESCE(SUM(mistake), 0)
+                 FROM actions""")
+
+def _migrate_v2(conn):
+    # Spans and counters exported by instrument.py
+    conn.execute("""CREATE TABLE IF NOT EXISTS trace_events (
+        id INTEGER PRIMARY KEY,
+        session_id INTEGER,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        started_at REAL,
+        duration_ms REAL,
+        value REAL,
+        attrs TEXT
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_events_name ON trace_events(name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_events_session ON trace_events(session_id)")
+
+def save_trace_events(events, db_path=None):
+    # events: dicts as produced by instrument.py
+    conn = sqlite3.connect(db_path or DB_PATH)
+    with conn:
+        conn.executemany("""INSERT INTO trace_events (session_id, kind, name, started_at, duration_ms, value, attrs)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                         [(_session_id, e["kind"], e["name"], e.get("start"), e.get("duration_ms"),
+                           e.get("value"), _trace_attrs(e)) for e in events])
+    conn.close()
+
+def _trace_attrs(event):
+    attrs = dict(event.get("attrs") or {})
+    for key in ("parent", "thread"):
+        if event.get(key):
+            attrs[key] = event[key]
+    return json.dumps(attrs) if attrs else None
+
+def start_session():
+    # Rows saved from now on belong to a new session
+    global _session_id, _game_id
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        _session_id = conn.execute("INSERT INTO sessions (started_at) VALUES (?)", (_now(),)).lastrowid
+    conn.close()
+    _game_id = None
+    return _session_id
+
+def start_game(difficulty):
+    # Rows saved from now on belong to a new game in the current session
+    global _game_id
+    if _session_id is None:
+        start_session()
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        _game_id = conn.execute("INSERT INTO games (session_id, difficulty, started_at) VALUES (?, ?, ?)",
+                                (_session_id, difficulty, _now())).lastrowid
+    conn.close()
+    return _game_id
 
 def save_performance(difficulty, time, errors):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("INSERT INTO scores (difficulty, time, errors) VALUES (?, ?, ?)",
-              (difficulty, time, errors))
+    c.execute("""INSERT INTO scores (difficulty, time, errors, session_id, game_id, created_at)
+                 VALUES (?, ?, ?, ?, ?, ?)""",
+              (difficulty, time, errors, _session_id, _game_id, _now()))
     conn.commit()
     conn.close()
 
 def get_summary():
+    # Per-difficulty (difficulty, avg time, avg errors), read from the summary table
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("""SELECT difficulty, AVG(time), AVG(errors)
-                 FROM scores GROUP BY difficulty""")
+    c.execute("""SELECT difficulty, total_time / games, 1.0 * total_errors / games
+                 FROM difficulty_stats WHERE games > 0 ORDER BY difficulty""")
     rows = c.fetchall()
     conn.close()
     return rows
 
+def get_session_summary(session_id=None):
+    # (games, total time, total errors, moves, mistakes) for one session,
+    # the current one by default
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT games, total_time, total_errors, moves, mistakes FROM session_stats WHERE session_id = ?",
+              (session_id if session_id is not None else _session_id,))
+    row = c.fetchone()
+    conn.close()
+    return row or (0, 0.0, 0, 0, 0)
+
+def get_action_totals():
+    # (avg time between moves, total mistakes, total moves) over all actions
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT total_time_delta / NULLIF(timed_moves, 0), mistakes, moves FROM action_totals")
+    row = c.fetchone()
+    conn.close()
+    return row
+
 def get_last_performance():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
@@ -42,11 +238,16 @@ def get_last_performance():
     conn.close()
     return row
 
-def plot_progress():
+def plot_progress(last=None):
+    # Plots every game, or only the `last` most recent ones
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id, time, errors, difficulty FROM scores ORDER BY id")
-    rows = c.fetchall()
+    if last:
+        c.execute("SELECT id, time, errors, difficulty FROM scores ORDER BY id DESC LIMIT ?", (last,))
+        rows = c.fetchall()[::-1]
+    else:
+        c.execute("SELECT id, time, errors, difficulty FROM scores ORDER BY id")
+        rows = c.fetchall()
     conn.close()
     if not rows:
         print("No data to plot.")
@@ -56,6 +257,7 @@ def plot_progress():
     errors = [row[2] for row in rows]
     difficulties = [row[3] for row in rows]
 
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10,5))
     plt.subplot(2,1,1)
     plt.plot(ids, times, marker='o')
@@ -81,14 +283,117 @@ def init_actions_db():
     )""")
     conn.commit()
     conn.close()
+    migrate()
+
+ACTION_FLUSH_SIZE = 64        # Flush once this many moves are queued
+ACTION_FLUSH_INTERVAL = 1.0   # ...or after this many seconds
+
+class ActionLogger:
+    # Queues moves in memory and writes them in batched transactions from a
+    # background thread that owns one long-lived WAL-mode connection, so the
+    # UI thread never waits on SQLite
+    def __init__(self, db_path=None, flush_size=ACTION_FLUSH_SIZE, flush_interval=ACTION_FLUSH_INTERVAL):
+        self.db_path = db_path or DB_PATH
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self._flush_requested = False
+        self._closed = False
+        self.flushes = 0
+        self.dropped = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self._thread = threading.Thread(target=self._run, name="action-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, row, col, value, time_delta, mistake):
+        with self._cond:
+            self._pending.append((row, col, value, time_delta, mistake, _session_id, _game_id, _now()))
+            self._enqueued += 1
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify_all()
+
+    def _ready(self):
+        return self._closed or self._flush_requested or len(self._pending) >= self.flush_size
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._ready, timeout=self.flush_interval)
+                batch, self._pending = self._pending, []
+                self._flush_requested = False
+                closed = self._closed
+            if batch:
+                start = time.perf_counter()
+                try:
+                    with conn:
+                        conn.executemany("""INSERT INTO actions (row, col, value, time_delta, mistake,
+                                                                 session_id, game_id, created_at)
+                                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", batch)
+                except sqlite3.Error as exc:
+                    print(f"Action logger: dropped {len(batch)} moves ({exc})", file=sys.stderr)
+                    self.dropped += len(batch)
+                latency = time.perf_counter() - start
+                self.flushes += 1
+                self.last_flush_latency = latency
+                self.max_flush_latency = max(self.max_flush_latency, latency)
+                self.total_flush_latency += latency
+            with self._cond:
+                self._written += len(batch)
+                self._cond.notify_all()
+                if closed and not self._pending:
+                    break
+        conn.close()
+
+    def flush(self):
+        # Block until every move logged so far has been written
+        with self._cond:
+            target = self._enqueued
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._written >= target or not self._thread.is_alive())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._pending)
+        return {
+            "queue_depth": depth,
+            "written": self._written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "avg_flush_latency": self.total_flush_latency / self.flushes if self.flushes else 0.0,
+        }
+
+_action_logger = None
+
+def get_action_logger():
+    global _action_logger
+    if _action_logger is None:
+        _action_logger = ActionLogger()
+    return _action_logger
 
 def save_action(row, col, value, time_delta, mistake):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO actions (row, col, value, time_delta, mistake) VALUES (?, ?, ?, ?, ?)",
-              (row, col, value, time_delta, mistake))
-    conn.commit()
-    conn.close()
+    get_action_logger().log(row, col, value, time_delta, mistake)
+
+def flush_actions():
+    if _action_logger is not None:
+        _action_logger.flush()
 
 def plot_action_patterns():
     conn = sqlite3.connect(DB_PATH)
@@ -103,6 +408,7 @@ def plot_action_patterns():
     time_deltas = [row[0] for row in rows if row[0] is not None]
     mistakes = [row[1] for row in rows if row[1] is not None]
 
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12,5))
 
     # Histogram of time between moves
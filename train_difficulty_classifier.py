@@ -1,12 +1,169 @@
-import pandas as pd
-from sklearn.neural_network import MLPClassifier
-import joblib
-
-df = pd.read_csv("sudoku_difficulty_data.csv")
-X = df[["num_clues", "naked_single", "hidden_single", "naked_pair", "pointing_pair"]].values
-y = df["label"].values
-
-clf = MLPClassifier(hidden_layer_sizes=(10, 10), max_iter=1000, random_state=42)
-clf.fit(X, y)
-joblib.dump(clf, "difficulty_classifier.pkl")
-print("Model trained and saved as difficulty_classifier.pkl")
\ No newline at end of file
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+
+from inference import export_npz
+from solver import DIFFICULTIES, FEATURE_NAMES, FEATURE_SCHEMA
+
+# Streams the training data through MLPClassifier.partial_fit one chunk at a
+# time, so memory stays bounded by CHUNK_ROWS whatever the dataset size.
+# A fixed fraction of rows (chosen per row from the seed) is held out for
+# validation; training stops once validation loss has not improved for
+# PATIENCE epochs and the best epoch's model is kept. Each run is written to
+# MODEL_DIR as a numbered version with its metrics, then published to the
+# paths the game loads with atomic renames.
+
+DATA_PATH = "sudoku_difficulty_data.csv"
+CLASSIFIER_PKL = "difficulty_classifier.pkl"
+CLASSIFIER_NPZ = "difficulty_classifier.npz"
+MODEL_DIR = "models"
+CHUNK_ROWS = 65536
+VAL_FRACTION = 0.1
+MAX_EPOCHS = 200
+PATIENCE = 10
+HIDDEN_LAYERS = (10, 10)
+
+def iter_chunks(path, chunk=CHUNK_ROWS):
+    # (features, labels) arrays of at most chunk rows, from a CSV or a .bin
+    # dataset (dataset.py); rows without a label are skipped
+    if path.endswith(".bin"):
+        import dataset
+        names = np.array(dataset.read_header(path)["labels"])
+        for _, block in dataset.iter_blocks(path, chunk):
+            keep = block["label"] < len(names)
+            yield np.asarray(block["features"][keep], dtype=np.float64), names[block["label"][keep]]
+    else:
+        import pandas as pd
+        for df in pd.read_csv(path, chunksize=chunk):
+            df = df.dropna(subset=["label"])
+            yield df[FEATURE_NAMES].to_numpy(dtype=np.float64), df["label"].to_numpy(dtype=str)
+
+def feature_names(path):
+    if path.endswith(".bin"):
+        import dataset
+        return dataset.read_header(path)["features"]
+    return list(FEATURE_NAMES)
+
+def feature_schema(path):
+    import dataset
+    if path.endswith(".bin"):
+        return dataset.read_header(path)["feature_schema"]
+    return dataset.csv_feature_schema(path)
+
+def _split(seed, index, n, val_fraction):
+    # Validation mask for chunk `index`; the same rows every epoch
+    return np.random.default_rng([seed, index]).random(n) < val_fraction
+
+def _validate(clf, path, seed, val_fraction, chunk):
+    from sklearn.metrics import log_loss
+    loss = correct = total = 0.0
+    for index, (X, y) in enumerate(iter_chunks(path, chunk)):
+        mask = _split(seed, index, len(y), val_fraction)
+        if not mask.any():
+            continue
+        proba = clf.predict_proba(X[mask])
+        loss += log_loss(y[mask], proba, labels=clf.classes_) * mask.sum()
+        correct += (clf.classes_[proba.argmax(axis=1)] == y[mask]).sum()
+        total += mask.sum()
+    if not total:
+        return None
+    return {"val_loss": loss / total, "val_accuracy": correct / total, "val_rows": int(total)}
+
+def train(path=DATA_PATH, chunk=CHUNK_ROWS, val_fraction=VAL_FRACTION, max_epochs=MAX_EPOCHS,
+          patience=PATIENCE, seed=42, verbose=True):
+    # Returns (best classifier, metrics dict)
+    from sklearn.neural_network import MLPClassifier
+    clf = MLPClassifier(hidden_layer_sizes=HIDDEN_LAYERS, random_state=seed)
+    classes = np.array(DIFFICULTIES)
+    best, best_metrics, stale = None, None, 0
+    history = []
+    start = time.time()
+    for epoch in range(1, max_epochs + 1):
+        rng = np.random.default_rng([seed, epoch])
+        train_rows = 0
+        for index, (X, y) in enumerate(iter_chunks(path, chunk)):
+            mask = ~_split(seed, index, len(y), val_fraction)
+            order = rng.permutation(np.flatnonzero(mask))
+            if len(order):
+                clf.partial_fit(X[order], y[order], classes=classes)
+                train_rows += len(order)
+        if not train_rows:
+            raise ValueError(f"no training rows in {path}")
+        metrics = _validate(clf, path, seed, val_fraction, chunk)
+        if metrics is None:
+            # Too little data to hold any out: keep the latest model
+            best, best_metrics = clf, {"epoch": epoch}
+            continue
+        metrics["epoch"] = epoch
+        history.append(metrics)
+        if verbose:
+            print(f"epoch {epoch}: val_loss {metrics['val_loss']:.4f} val_accuracy {metrics['val_accuracy']:.4f}")
+        if best_metrics is None or metrics["val_loss"] < best_metrics.get("val_loss", float("inf")):
+            best, best_metrics, stale = copy.deepcopy(clf), metrics, 0
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+    best_metrics = dict(best_metrics, train_rows=train_rows, epochs_run=epoch,
+                        train_seconds=time.time() - start, history=history)
+    return best, best_metrics
+
+def _next_version(model_dir):
+    versions = [int(name[len("difficulty_classifier-v"):-len(".json")]) for name in os.listdir(model_dir)
+                if name.startswith("difficulty_classifier-v") and name.endswith(".json")]
+    return max(versions, default=0) + 1
+
+def _dump_atomic(obj, path):
+    import joblib
+    tmp = path + ".tmp"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+def save_model(clf, metrics, path, model_dir=MODEL_DIR, publish=True):
+    # Write version N (pickle, npz weights, metrics JSON) to model_dir and,
+    # with publish, replace the game's model files with it. Every file is
+    # written under a temporary name and renamed into place.
+    schema = feature_schema(path)
+    if publish and feature_names(path) != FEATURE_NAMES:
+        raise ValueError(f"the game rates puzzles with {FEATURE_NAMES}; train on those or use publish=False")
+    if publish and schema != FEATURE_SCHEMA:
+        raise ValueError(f"{path} uses feature schema {schema} but the game uses {FEATURE_SCHEMA}; "
+                         "recompute or collect the data again, or use publish=False")
+    os.makedirs(model_dir, exist_ok=True)
+    version = _next_version(model_dir)
+    base = os.path.join(model_dir, f"difficulty_classifier-v{version}")
+    info = dict(metrics, version=version, dataset=os.path.abspath(path), features=feature_names(path),
+                feature_schema=schema, classes=[str(c) for c in clf.classes_], created_at=time.time())
+    _dump_atomic(clf, base + ".pkl")
+    export_npz(clf, base + ".npz", version=version, feature_schema=schema)
+    if publish:
+        _dump_atomic(clf, CLASSIFIER_PKL)
+        export_npz(clf, CLASSIFIER_NPZ, version=version, feature_schema=schema)
+    tmp = base + ".json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp, base + ".json")
+    return version
+
+def train_and_save(path=DATA_PATH, publish=True, **kwargs):
+    clf, metrics = train(path, **kwargs)
+    version = save_model(clf, metrics, path, publish=publish)
+    print(f"Model v{version} trained and saved as {CLASSIFIER_PKL}" if publish else f"Model v{version} saved")
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the difficulty classifier out of core.")
+    parser.add_argument("--data", default=DATA_PATH, help="training CSV or .bin dataset")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION)
+    parser.add_argument("--max-epochs", type=int, default=MAX_EPOCHS)
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-publish", action="store_true", help="only write the versioned files")
+    args = parser.parse_args()
+    train_and_save(args.data, publish=not args.no_publish, chunk=args.chunk, val_fraction=args.val_fraction,
+                   max_epochs=args.max_epochs, patience=args.patience, seed=args.seed)
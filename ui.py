@@ -1,7 +1,9 @@
+import os
 import pygame
 import time
-from tracking import save_performance, save_action
-from solver import solve
+from tracking import save_performance, save_action, flush_actions
+from puzzle import Puzzle
+from live import LiveAnalyzer
 
 # Constants for the grid and neural network diagram
 GRID_SIZE = 9
@@ -64,7 +66,147 @@ def draw_nn_diagram(
                 color = (0, 0, 255)
             pygame.draw.circle(screen, color, (x, y), 22)
 
-def run_ui(puzzle, difficulty, suggested, nn_activations=None):
+BOARD_RECT = pygame.Rect(0, 0, 545, 545)
+INFO_RECT = pygame.Rect(0, 545, 700, 55)
+NN_RECT = pygame.Rect(700, 0, 700, 600)
+NN_CENTER = (975, 300)
+
+class NNDiagramCache:
+    # Off-screen copies of the NN diagram, one per (activations, flash) state,
+    # so the ~190 connection lines are drawn once instead of every frame.
+    # Live activations change with every move, so only the most recent
+    # max_surfaces states are kept.
+    def __init__(self, rect=NN_RECT, center=NN_CENTER, max_surfaces=8):
+        self.rect = rect
+        self.center = center
+        self.max_surfaces = max_surfaces
+        self._surfaces = {}
+
+    def get(self, activations, flashing):
+        # Activations are only drawn while flashing, so every other frame
+        # shares one surface
+        key = (tuple(map(tuple, activations)) if activations and flashing else None, flashing)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = pygame.Surface(self.rect.size)
+            surface.fill((255,255,255))
+            draw_nn_diagram(
+                surface, self.center[0] - self.rect.x, self.center[1] - self.rect.y,
+                activations=activations if flashing else None
+            )
+            if len(self._surfaces) >= self.max_surfaces:
+                del self._surfaces[next(iter(self._surfaces))]
+            self._surfaces[key] = surface
+        return surface
+
+class Renderer:
+    # Redraws only the regions whose content changed since the last frame and
+    # pushes just those rectangles to the display. The first frame, and the
+    # first after invalidate() (e.g. when the window was exposed), repaints
+    # the whole window, including the strip between the board and the diagram
+    # that no region covers.
+    def __init__(self, screen, font, bold_font, nn_activations=None, full_redraw=False):
+        self.screen = screen
+        self.font = font
+        self.small_font = pygame.font.SysFont(None, 24)  # Second line of the info bar (hints)
+        self.full_redraw = full_redraw
+        # Pre-rendered digits: givens in bold, user entries regular
+        self.given_glyphs = [None] + [bold_font.render(str(n), True, (0,0,0)) for n in range(1, 10)]
+        self.user_glyphs = [None] + [font.render(str(n), True, (0,0,0)) for n in range(1, 10)]
+        self.nn_cache = NNDiagramCache()
+        self.nn_activations = nn_activations
+        self._board_key = None
+        self._info = None
+        self._flashing = None
+        self._activations = None
+        self._invalid = True
+
+    def invalidate(self):
+        self._invalid = True
+
+    def draw(self, grid, puzzle, selected, info_text, flashing):
+        screen = self.screen
+        dirty = []
+        repaint = self.full_redraw or self._invalid
+        if repaint:
+            screen.fill((255,255,255))
+            self._board_key = self._info = self._flashing = None
+            self._invalid = False
+        board_key = (tuple(v for row in grid for v in row), selected)
+        if board_key != self._board_key:
+            self._board_key = board_key
+            screen.fill((255,255,255), BOARD_RECT)
+            for i in range(10):
+                width = 4 if i % 3 == 0 else 1
+                pygame.draw.line(screen, (0,0,0), (0, i*60), (540, i*60), width)
+                pygame.draw.line(screen, (0,0,0), (i*60, 0), (i*60, 540), width)
+            for i in range(9):
+                for j in range(9):
+                    if grid[i][j]:
+                        # Original numbers in bold, user-filled numbers regular
+                        glyphs = self.given_glyphs if puzzle[i][j] != 0 else self.user_glyphs
+                        screen.blit(glyphs[grid[i][j]], (j*60+20, i*60+15))
+            if selected:
+                pygame.draw.rect(screen, (0,255,0), (selected[1]*60, selected[0]*60, 60, 60), 3)
+            dirty.append(BOARD_RECT)
+        if info_text != self._info:
+            self._info = info_text
+            screen.fill((255,255,255), INFO_RECT)
+            # First line in the regular font, a second one (the hint) below it
+            # in the small font; both are clipped to the info bar
+            status, _, extra = info_text.partition("\n")
+            screen.set_clip(INFO_RECT)
+            screen.blit(self.font.render(status, True, (0,0,255)), (10, 550))
+            if extra:
+                screen.blit(self.small_font.render(extra, True, (0,0,255)), (10, 578))
+            screen.set_clip(None)
+            dirty.append(INFO_RECT)
+        if flashing != self._flashing or self.nn_activations is not self._activations:
+            self._flashing = flashing
+            self._activations = self.nn_activations
+            screen.blit(self.nn_cache.get(self.nn_activations, flashing), NN_RECT)
+            dirty.append(NN_RECT)
+        if repaint:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+def frame_benchmark(puzzle, frames=300, move_every=30, full_redraw=False, nn_activations=None):
+    # Headless frame-time benchmark (SDL dummy driver). A move is simulated
+    # every move_every frames; returns frame times in milliseconds.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.display.set_mode((1400, 600))
+    font = pygame.font.SysFont(None, 40)
+    bold_font = pygame.font.SysFont(None, 40, bold=True)
+    renderer = Renderer(screen, font, bold_font, nn_activations, full_redraw=full_redraw)
+    grid = Puzzle.of(puzzle).to_grid()
+    empty = [(i, j) for i in range(9) for j in range(9) if puzzle[i][j] == 0]
+    times = []
+    flashing = False
+    for frame in range(frames):
+        if move_every and frame % move_every == 0 and empty:
+            i, j = empty[(frame // move_every) % len(empty)]
+            grid[i][j] = grid[i][j] % 9 + 1
+            flashing = True
+        elif move_every and frame % move_every == 9:
+            flashing = False
+        start = time.perf_counter()
+        renderer.draw(grid, puzzle, empty[0] if empty else None,
+                      f"Diff: Bench  Time: {frame // 30}s  Errors: 0", flashing)
+        times.append((time.perf_counter() - start) * 1000)
+    pygame.quit()
+    times.sort()
+    return {
+        "frames": frames,
+        "mean_ms": sum(times) / len(times),
+        "median_ms": times[len(times) // 2],
+        "p95_ms": times[int(len(times) * 0.95)],
+        "max_ms": times[-1],
+    }
+
+def run_ui(puzzle, difficulty, suggested, nn_activations=None, on_first_frame=None):
     pygame.init()
     screen = pygame.display.set_mode((1400, 600))
     pygame.display.set_caption("Sudoku")
@@ -77,10 +219,14 @@ def run_ui(puzzle, difficulty, suggested, nn_activations=None):
     start_ticks = pygame.time.get_ticks()
     last_move_time = time.time()
 
-    grid = [row[:] for row in puzzle]
-    solution = [row[:] for row in puzzle]
-    solve(solution)
+    puzzle = Puzzle.of(puzzle)
+    grid = puzzle.to_grid()
+    solution = puzzle.solution  # Known from generation, solved only if missing
     wrong_cells = set()
+    # Candidates, hints and classifier activations for the board as it is
+    # filled in; activations are only shown when a classifier was available
+    live = LiveAnalyzer(puzzle, solution)
+    hint = None
 
     # Animation state
     input_flash = None
@@ -88,68 +234,40 @@ def run_ui(puzzle, difficulty, suggested, nn_activations=None):
     hidden_flash = [False] * 5
     flash_timer = 0
 
+    renderer = Renderer(screen, font, bold_font, nn_activations)
+
     while running:
-        screen.fill((255,255,255))
-        # Draw grid
-        for i in range(10):
-            width = 4 if i % 3 == 0 else 1
-            pygame.draw.line(screen, (0,0,0), (0, i*60), (540, i*60), width)
-            pygame.draw.line(screen, (0,0,0), (i*60, 0), (i*60, 540), width)
-        # Draw numbers
-        for i in range(9):
-            for j in range(9):
-                if grid[i][j]:
-                    if puzzle[i][j] != 0:
-                        num_font = bold_font  # Original numbers in bold
-                    else:
-                        num_font = font      # User-filled numbers regular
-                    color = (0,0,0)
-                    img = num_font.render(str(grid[i][j]), True, color)
-                    screen.blit(img, (j*60+20, i*60+15))
-        # Draw selection
-        if selected:
-            pygame.draw.rect(screen, (0,255,0), (selected[1]*60, selected[0]*60, 60, 60), 3)
-        # Draw info
         elapsed = (pygame.time.get_ticks() - start_ticks) // 1000
-        info = font.render(f"Diff: {difficulty}  Time: {elapsed}s  Errors: {errors}", True, (0,0,255))
-        screen.blit(info, (10, 550))
-
-        # Prepare NN input/output values
-        input_vals = [elapsed, errors, difficulty]
-        output_val = suggested  # Use the passed-in argument
-
-        # Animate NN diagram
-        if flash_timer and pygame.time.get_ticks() - flash_timer < 300:
-            draw_nn_diagram(
-                screen, 975, 300,  # was 950, 300
-                activations=nn_activations,
-                input_vals=input_vals,
-                output_val=output_val,
-                input_highlight=input_flash,
-                output_highlight=output_flash,
-                hidden_highlight=hidden_flash
-            )
-        else:
-            draw_nn_diagram(
-                screen, 975, 300,
-                input_vals=input_vals,
-                output_val=output_val
-            )
+        # NN diagram shows the activations for 300 ms after each move
+        flashing = bool(flash_timer and pygame.time.get_ticks() - flash_timer < 300)
+        if not flashing:
             input_flash = None
             output_flash = False
             hidden_flash = [False] * 5
             flash_timer = 0
-
-        pygame.display.flip()
+        info_text = f"Diff: {difficulty}  Time: {elapsed}s  Errors: {errors}"
+        if hint:
+            info_text += f"\nHint: {hint['text']}"
+        renderer.draw(grid, puzzle, selected, info_text, flashing)
+        if on_first_frame is not None:
+            on_first_frame()
+            on_first_frame = None
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 save_performance(difficulty, elapsed, errors)
                 running = False
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                renderer.invalidate()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 x, y = event.pos
                 if x < 540 and y < 540:
                     selected = (y//60, x//60)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                # Next logical step for the board as it stands
+                hint = live.hint()
+                if "cell" in hint:
+                    selected = hint["cell"]
             elif event.type == pygame.KEYDOWN and selected:
                 if event.key in range(pygame.K_1, pygame.K_9+1):
                     val = event.key - pygame.K_0
@@ -160,6 +278,10 @@ def run_ui(puzzle, difficulty, suggested, nn_activations=None):
                         last_move_time = now
                         mistake = int(val != solution[i][j])
                         save_action(i, j, val, time_delta, mistake)
+                        live.place(i, j, val)
+                        hint = None
+                        if nn_activations is not None:
+                            renderer.nn_activations = live.activations()
                         if val == solution[i][j]:
                             grid[i][j] = val
                             if (i, j) in wrong_cells:
@@ -188,7 +310,15 @@ def run_ui(puzzle, difficulty, suggested, nn_activations=None):
                         grid[i][j] = 0
                         if (i, j) in wrong_cells:
                             wrong_cells.remove((i, j))
+                        live.delete(i, j)
+                        hint = None
+                        if nn_activations is not None:
+                            renderer.nn_activations = live.activations()
                 elif event.key == pygame.K_ESCAPE:
                     selected = None
+                    hint = None
         clock.tick(30)
+    # Moves are logged in the background; make sure they reach the database.
+    # If the loop raises instead, the logger's atexit hook flushes them.
+    flush_actions()
     pygame.quit()